@@ -3,3 +3,24 @@ from django.conf import settings
 
 HTTP_ERROR_INCLUDE_CLASS_NAME = getattr(settings, "HTTP_ERROR_INCLUDE_CLASS_NAME", True)
 HTTP_ERROR_WRAP_IN_ERROR_DICT = getattr(settings, "HTTP_ERROR_WRAP_IN_ERROR_DICT", True)
+NUMBER_GENERATOR_BLOCK_SIZE = getattr(settings, "NUMBER_GENERATOR_BLOCK_SIZE", None)
+NUMBER_GENERATOR_KNOWN_SEQUENCES_SIZE = getattr(settings, "NUMBER_GENERATOR_KNOWN_SEQUENCES_SIZE", 4096)
+HTTP_JSON_FAST_ENCODER = getattr(settings, "HTTP_JSON_FAST_ENCODER", False)
+HTTP_STATIC_FILE_CACHE_MAX_SIZE = getattr(settings, "HTTP_STATIC_FILE_CACHE_MAX_SIZE", 256 * 1024)
+HTTP_STATIC_FILE_SENDFILE_HEADER = getattr(settings, "HTTP_STATIC_FILE_SENDFILE_HEADER", None)
+HTTP_STATIC_FILE_SENDFILE_URL = getattr(settings, "HTTP_STATIC_FILE_SENDFILE_URL", "/static/")
+HTTP_TRUSTED_PROXIES = getattr(settings, "HTTP_TRUSTED_PROXIES", [])
+MAIL_QUEUED = getattr(settings, "MAIL_QUEUED", False)
+MAIL_QUEUE_WORKERS = getattr(settings, "MAIL_QUEUE_WORKERS", 2)
+MAIL_QUEUE_MAX_SIZE = getattr(settings, "MAIL_QUEUE_MAX_SIZE", 1000)
+MAIL_QUEUE_MAX_RETRIES = getattr(settings, "MAIL_QUEUE_MAX_RETRIES", 3)
+MAIL_QUEUE_RETRY_BACKOFF = getattr(settings, "MAIL_QUEUE_RETRY_BACKOFF", 1.0)
+MAIL_QUEUE_PUT_TIMEOUT = getattr(settings, "MAIL_QUEUE_PUT_TIMEOUT", 10)
+TRANSACTION_COMPLETE_PENDING_MAX_SIZE = getattr(settings, "TRANSACTION_COMPLETE_PENDING_MAX_SIZE", 10000)
+TRANSACTION_COMPLETE_ASYNC_CONCURRENCY = getattr(settings, "TRANSACTION_COMPLETE_ASYNC_CONCURRENCY", 10)
+TRANSACTION_COMPLETE_THREAD_POOL_SIZE = getattr(settings, "TRANSACTION_COMPLETE_THREAD_POOL_SIZE", 8)
+DB_SERIALIZATION_RETRY_MAX_ATTEMPTS = getattr(settings, "DB_SERIALIZATION_RETRY_MAX_ATTEMPTS", 5)
+IMAGE_MAX_PIXELS = getattr(settings, "IMAGE_MAX_PIXELS", None)
+IMAGE_RENDITION_PROCESSES = getattr(settings, "IMAGE_RENDITION_PROCESSES", None)
+MOZJPEG_MAX_IN_FLIGHT = getattr(settings, "MOZJPEG_MAX_IN_FLIGHT", 4)
+MOZJPEG_QUEUE_TIMEOUT = getattr(settings, "MOZJPEG_QUEUE_TIMEOUT", 5)
@@ -0,0 +1,27 @@
+import threading
+
+
+class Counters:
+    """
+    Thread-safe named counters, the keyword arguments define the counters and their initial values,
+    e.g. `Counters(executed=0, execution_time=0.0)`.
+    """
+
+    def __init__(self, **initial):
+        self._lock = threading.Lock()
+        self._initial = initial
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            for name, value in self._initial.items():
+                setattr(self, name, value)
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {name: getattr(self, name) for name in self._initial}
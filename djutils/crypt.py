@@ -1,12 +1,19 @@
+import os
 import warnings
 import secrets
 import string
+import threading
 import hmac
 import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Union
 
 ASCII_NOT_CONFUSABLE = "ABCEFGHJKLMNPQRSTUWXYZ123456789"
+RANDOM_STRING_CHARS = string.ascii_lowercase + string.ascii_uppercase + string.digits
 
-def random_string_generator(size=16, chars=string.ascii_lowercase + string.ascii_uppercase + string.digits):
+def random_string_generator(size=16, chars=RANDOM_STRING_CHARS):
     """
     DEPRECATED: Use `get_random_string` from `django.utils.crypto` instead
     Generate a secure random string with length `size` out of the defined charset `chars`.
@@ -15,18 +22,146 @@ def random_string_generator(size=16, chars=string.ascii_lowercase + string.ascii
     choice = secrets.SystemRandom().choice
     return ''.join(choice(chars) for _ in range(size))
 
+class HMACHasher:
+    """
+    HMAC hasher keyed with `key`.
+    The inner and outer HMAC state is computed once and copied for each message.
+    """
+
+    def __init__(self, key, digestmod=hashlib.sha256):
+        self._hmac = hmac.new(key=_encode(key), digestmod=digestmod)
+
+    def new(self):
+        return self._hmac.copy()
+
+    def digest(self, msg) -> bytes:
+        hasher = self._hmac.copy()
+        hasher.update(_encode(msg))
+        return hasher.digest()
+
+    def hexdigest(self, msg) -> str:
+        hasher = self._hmac.copy()
+        hasher.update(_encode(msg))
+        return hasher.hexdigest()
+
+    def hash_many(self, msgs: Iterable, workers: Optional[int] = None, chunksize: int = 64) -> Iterator[str]:
+        """
+        Hexdigests of all `msgs` in order. Streams, so `msgs` may be a generator.
+        With `workers` a thread pool is used, which only pays off for large messages as hashlib releases the GIL on
+        buffers larger than 2047 bytes.
+        """
+        if not workers:
+            for msg in msgs:
+                yield self.hexdigest(msg)
+
+            return
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for msg in msgs:
+                pending.append(executor.submit(self.hexdigest, msg))
+                if len(pending) >= workers * chunksize:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def hash_file(self, file: Union[str, BinaryIO], chunk_size: int = 1024 * 1024) -> str:
+        """ Hexdigest of a file (path or binary file object), read in chunks of `chunk_size` """
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, 'rb') as fileobj:
+                return self.hash_file(fileobj, chunk_size=chunk_size)
+
+        hasher = self._hmac.copy()
+        for chunk in iter(partial(file.read, chunk_size), b''):
+            hasher.update(chunk)
+
+        return hasher.hexdigest()
+
+
+def _encode(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+@lru_cache(maxsize=32)
+def _get_cached_hasher(key, digestmod) -> HMACHasher:
+    return HMACHasher(key, digestmod=digestmod)
+
+
+def get_hasher(key, digestmod=hashlib.sha256) -> HMACHasher:
+    """
+    Cached `HMACHasher` for `key`, keeping up to 32 keys alive.
+    Unhashable keys (e.g. `bytearray`) get a new, uncached hasher.
+    """
+    try:
+        return _get_cached_hasher(key, digestmod)
+
+    except TypeError:
+        return HMACHasher(key, digestmod=digestmod)
+
+
 def sha512_hash(key, msg):
     """ SHA512 hexdigest of `msg` salted with `key`. UTF-8 Encoded. """
-    return hmac.new(
-        key=key.encode('utf-8') if isinstance(key, str) else key,
-        msg=msg.encode('utf-8') if isinstance(msg, str) else msg,
-        digestmod=hashlib.sha512
-    ).hexdigest()
+    return hmac.new(key=_encode(key), msg=_encode(msg), digestmod=hashlib.sha512).hexdigest()
 
 def sha256_hash(key, msg):
     """ SHA256 hexdigest of `msg` salted with `key`. UTF-8 Encoded. """
-    return hmac.new(
-        key=key.encode('utf-8') if isinstance(key, str) else key,
-        msg=msg.encode('utf-8') if isinstance(msg, str) else msg,
-        digestmod=hashlib.sha256
-    ).hexdigest()
+    return hmac.new(key=_encode(key), msg=_encode(msg), digestmod=hashlib.sha256).hexdigest()
+
+
+class RandomStringGenerator:
+    """
+    Secure random strings out of the ASCII charset `chars`.
+    Random bytes are drawn from `os.urandom` in blocks of `buffer_size` and mapped onto the charset with
+    `bytes.translate`. Bytes outside of the charset (after masking to the next power of two) are rejected, so there is
+    no modulo bias. The buffer is discarded in forked processes.
+    """
+
+    def __init__(self, chars: str = RANDOM_STRING_CHARS, buffer_size: int = 4096):
+        if not chars or len(chars) > 256 or any(ord(char) > 127 for char in chars) or len(set(chars)) != len(chars):
+            raise ValueError("chars must consist of 1 to 256 unique ASCII characters")
+
+        self.chars = chars
+        self.buffer_size = buffer_size
+        mask = (1 << (len(chars) - 1).bit_length()) - 1
+        self._table = bytes(ord(chars[b & mask]) if b & mask < len(chars) else 0 for b in range(256))
+        self._delete = bytes(b for b in range(256) if b & mask >= len(chars))
+        # Fraction of random bytes which are accepted
+        self._yield = len(chars) / (mask + 1)
+        self._buffer = ''
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _draw(self, size: int) -> str:
+        chars = ''
+        while len(chars) < size:
+            missing = size - len(chars)
+            data = os.urandom(max(self.buffer_size, int(missing / self._yield * 1.1) + 16))
+            chars += data.translate(self._table, self._delete).decode('ascii')
+
+        return chars
+
+    def _take(self, size: int) -> str:
+        with self._lock:
+            if self._pid != os.getpid():
+                self._buffer = ''
+                self._pid = os.getpid()
+
+            if len(self._buffer) < size:
+                self._buffer += self._draw(size - len(self._buffer))
+
+            chars, self._buffer = self._buffer[:size], self._buffer[size:]
+            return chars
+
+    def generate(self, length: int) -> str:
+        return self._take(length)
+
+    def generate_many(self, n: int, length: int) -> List[str]:
+        chars = self._take(n * length)
+        return [chars[i:i + length] for i in range(0, n * length, length)]
+
+
+@lru_cache(maxsize=None)
+def get_random_string_generator(chars: str = RANDOM_STRING_CHARS) -> RandomStringGenerator:
+    """ Shared `RandomStringGenerator` for `chars` """
+    return RandomStringGenerator(chars)
@@ -1,2 +1,5 @@
-from .functions import Levenshtein
-from .extensions import FuzzystrExtension
+from .functions import Levenshtein, LevenshteinLessEqual, MaskIPAddress, TrigramSimilar
+from .extensions import FuzzystrExtension, TrigramExtension
+from .indexes import CreateJSONBPathOpsIndex, CreateJSONPathIndex, json_path_index, jsonb_path_ops_index
+from .retry import retrying_atomic
+from .search import fuzzy_search, trigram_index
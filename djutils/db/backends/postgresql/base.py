@@ -4,12 +4,17 @@ https://github.com/LaVita-GmbH/olympus
 """
 
 import logging
+import threading
+from functools import partial
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.asyncio import async_unsafe
 from django.db.backends.postgresql.base import (
     DatabaseWrapper as PGSQLDatabaseWrapper,
     CursorDebugWrapper as BaseCursorDebugWrapper,
 )
 from django.db.backends.utils import CursorWrapper as BaseCursorWrapper
+from ... import instrumentation
+from ...pool import ConnectionPool
 from ...utils import ReconnectingCursorMixin
 
 try:
@@ -28,11 +33,68 @@ class CursorDebugWrapper(ReconnectingCursorMixin, BaseCursorDebugWrapper):
 
 
 class DatabaseWrapper(PGSQLDatabaseWrapper):
+    """
+    PostgreSQL backend which reconnects on connection errors.
+
+    An in-process connection pool (`ConnectionPool`) shared by all threads is enabled with the `DJUTILS_POOL` key of
+    the database settings, set to `True` or a dict of `ConnectionPool` arguments, e.g.
+    `'DJUTILS_POOL': {'min_size': 2, 'max_size': 20, 'max_idle': 300}`.
+    Closing the connection (e.g. with `CONN_MAX_AGE = 0` at the end of each request) returns it to the pool.
+    On Django >= 5.1, Django's own pool (`OPTIONS['pool']`, psycopg_pool) can be used instead; broken connections
+    are returned to it on reconnect.
+    """
+
+    _pools = {}
+    _pools_lock = threading.Lock()
+
+    @property
+    def djutils_pool(self):
+        options = self.settings_dict.get('DJUTILS_POOL')
+        if not options:
+            return None
+
+        if self.settings_dict.get('OPTIONS', {}).get('pool'):
+            raise ImproperlyConfigured("DJUTILS_POOL cannot be combined with OPTIONS['pool']")
+
+        with self._pools_lock:
+            pool = self._pools.get(self.alias)
+            if pool is None:
+                pool = self._pools[self.alias] = ConnectionPool(**(options if isinstance(options, dict) else {}))
+
+            return pool
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        pool = self.djutils_pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        return pool.getconn(partial(super().get_new_connection, conn_params))
+
+    def _close(self):
+        pool = self.djutils_pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            pool.putconn(self.connection)
+
     @async_unsafe
     def _reconnect(self):
         logging.info("Reconnecting to DB")
+        instrumentation.counters.add(reconnects=1)
+        pool = self.djutils_pool
         try:
-            self.connection.close()
+            if pool is not None:
+                pool.putconn(self.connection, discard=True)
+
+            elif getattr(self, 'pool', None):
+                # Django's pool (Django >= 5.1) discards closed connections when they are returned
+                self.connection.close()
+                self.connection._pool.putconn(self.connection)
+
+            else:
+                self.connection.close()
 
         except Exception as error:
             logging.warning(error)
@@ -4,3 +4,8 @@ from django.contrib.postgres.operations import CreateExtension
 class FuzzystrExtension(CreateExtension):
     def __init__(self):
         self.name = 'fuzzystrmatch'
+
+
+class TrigramExtension(CreateExtension):
+    def __init__(self):
+        self.name = 'pg_trgm'
@@ -1,14 +1,65 @@
-from django.db.models import Func
+from django.db.models import BooleanField, Func, GenericIPAddressField, IntegerField, Value
 
 
 class Levenshtein(Func):
     """ For use of the levenshtein algorithm with a PostgreSQL Database """
-    template = "%(function)s(%(expressions)s, '%(search_term)s')"
     function = "levenshtein"
+    output_field = IntegerField()
 
     def __init__(self, expression, search_term, **extras):
         super().__init__(
             expression,
-            search_term=search_term,
+            Value(search_term),
             **extras
         )
+
+
+class LevenshteinLessEqual(Func):
+    """
+    Levenshtein distance which stops calculating once `max_distance` is exceeded (the result is then any value
+    greater than `max_distance`). Requires the `fuzzystrmatch` extension.
+    """
+    function = "levenshtein_less_equal"
+    output_field = IntegerField()
+
+    def __init__(self, expression, search_term, max_distance, **extras):
+        super().__init__(
+            expression,
+            Value(search_term),
+            Value(max_distance),
+            **extras
+        )
+
+
+class TrigramSimilar(Func):
+    """
+    Whether `expression` is similar to `search_term` (`%` operator of the `pg_trgm` extension), which can be served
+    by a trigram index (see `djutils.db.search.trigram_index`).
+    """
+    template = "%(expressions)s"
+    arg_joiner = " %% "
+    output_field = BooleanField()
+
+    def __init__(self, expression, search_term, **extras):
+        super().__init__(
+            expression,
+            Value(search_term),
+            **extras
+        )
+
+
+class MaskIPAddress(Func):
+    """
+    Masks an IP-Address like `djutils.ip.mask_ip_address` (/24 for IPv4, /56 for IPv6) with a PostgreSQL Database.
+    """
+    template = (
+        "host(network(set_masklen((%(expressions)s)::inet, "
+        "CASE WHEN family((%(expressions)s)::inet) = 4 THEN 24 ELSE 56 END)))::inet"
+    )
+    arity = 1
+    output_field = GenericIPAddressField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = super().as_sql(compiler, connection, **extra_context)
+        # The expression is used twice within the template
+        return sql, (*params, *params)
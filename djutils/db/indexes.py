@@ -0,0 +1,89 @@
+from typing import Sequence
+from django.contrib.postgres.indexes import GinIndex
+from django.db.migrations.operations.base import Operation
+from django.db.models import F, Index
+from ..models import JSONExtractPathText
+
+
+def jsonb_path_ops_index(field: str, name: str) -> GinIndex:
+    """
+    GIN index with the `jsonb_path_ops` operator class on `field`, for use in `Meta.indexes`.
+    Serves containment (`@>`, `__contains`, `JSONContains`) and SQL/JSON path (`JSONPathExists`, `JSONPathMatch`)
+    queries.
+    """
+    return GinIndex(fields=[field], name=name, opclasses=['jsonb_path_ops'])
+
+
+def json_path_index(field: str, path: Sequence[str], name: str) -> Index:
+    """ Expression index on the text value at `path` of `field`, serves filters on `JSONExtractPathText` """
+    return Index(JSONExtractPathText(F(field), *path), name=name)
+
+
+class _CreateIndex(Operation):
+    """
+    Creates an index without adding it to the migration state, for indexes which are not declared in
+    `Meta.indexes` (declared indexes are handled by `makemigrations`).
+    """
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(self, model_name: str, name: str):
+        self.model_name = model_name
+        self.name = name
+
+    def get_index(self):
+        raise NotImplementedError
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.add_index(model, self.get_index())
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.remove_index(model, self.get_index())
+
+    def describe(self):
+        return "Create index %s on %s" % (self.name, self.model_name)
+
+
+class CreateJSONBPathOpsIndex(_CreateIndex):
+    """ Migration operation creating a `jsonb_path_ops_index` """
+
+    def __init__(self, model_name: str, field: str, name: str):
+        super().__init__(model_name, name)
+        self.field = field
+
+    def get_index(self):
+        return jsonb_path_ops_index(self.field, self.name)
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {
+            'model_name': self.model_name,
+            'field': self.field,
+            'name': self.name,
+        }
+
+
+class CreateJSONPathIndex(_CreateIndex):
+    """ Migration operation creating a `json_path_index` """
+
+    def __init__(self, model_name: str, field: str, path: Sequence[str], name: str):
+        super().__init__(model_name, name)
+        self.field = field
+        self.path = list(path)
+
+    def get_index(self):
+        return json_path_index(self.field, self.path, self.name)
+
+    def deconstruct(self):
+        return self.__class__.__name__, [], {
+            'model_name': self.model_name,
+            'field': self.field,
+            'path': self.path,
+            'name': self.name,
+        }
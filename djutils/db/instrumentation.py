@@ -0,0 +1,153 @@
+"""
+Lightweight query instrumentation for the reconnecting cursors of the djutils database backends.
+Queries are only timed while a subscriber is registered or a query budget is active.
+"""
+
+import logging
+import re
+import threading
+import warnings
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Optional
+from ..counters import Counters
+
+
+_logger = logging.getLogger(__name__)
+
+_subscribers = []
+_query_budget: ContextVar[Optional['QueryBudget']] = ContextVar('query_budget', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Reconnects and retried queries
+counters = Counters(reconnects=0, retries=0)
+
+
+def subscribe(subscriber: Callable):
+    """ Register `subscriber(sql, duration, many)`, called after each query; `duration` is in seconds """
+    if subscriber not in _subscribers:
+        _subscribers.append(subscriber)
+
+
+def unsubscribe(subscriber: Callable):
+    try:
+        _subscribers.remove(subscriber)
+
+    except ValueError:
+        pass
+
+
+def is_active() -> bool:
+    return bool(_subscribers) or _query_budget.get() is not None
+
+
+def check_budget():
+    """ Count a query against the active query budget, called before the query is executed """
+    budget = _query_budget.get()
+    if budget is not None:
+        budget.count()
+
+
+def record(sql: str, duration: float, many: bool):
+    for subscriber in _subscribers:
+        try:
+            subscriber(sql, duration, many)
+
+        except Exception as error:
+            _logger.exception(error)
+
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|%\(\w+\)s|\$\d+')
+_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """ Normalise `sql` by replacing literals and placeholders with `?` and collapsing lists and whitespace """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _LIST_RE.sub('(...)', sql)
+    return _WHITESPACE_RE.sub(' ', sql).strip()
+
+
+class QueryHistogram:
+    """ Subscriber collecting a histogram of query durations per SQL fingerprint """
+
+    def __init__(self, buckets: tuple = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def __call__(self, sql: str, duration: float, many: bool):
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    'count': 0,
+                    'total': 0.0,
+                    'buckets': [0] * (len(self.buckets) + 1),
+                }
+
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['buckets'][bisect_left(self.buckets, duration)] += 1
+
+    def snapshot(self) -> dict:
+        """ `{fingerprint: {'count', 'total', 'buckets'}}`, the last bucket counts durations above all bounds """
+        with self._lock:
+            return {key: {**stats, 'buckets': list(stats['buckets'])} for key, stats in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class SlowQueryLogger:
+    """ Subscriber logging queries which took longer than `threshold` seconds """
+
+    def __init__(self, threshold: float = 1.0, logger: logging.Logger = _logger):
+        self.threshold = threshold
+        self.logger = logger
+
+    def __call__(self, sql: str, duration: float, many: bool):
+        if duration >= self.threshold:
+            self.logger.warning("Slow query (%.3fs): %s", duration, sql)
+
+
+class QueryBudget:
+    """
+    Context manager limiting the number of queries, e.g. per request.
+    Exceeding `max_queries` warns once, or raises `QueryBudgetExceeded` with `raise_exception`.
+    """
+
+    def __init__(self, max_queries: int, raise_exception: bool = False):
+        self.max_queries = max_queries
+        self.raise_exception = raise_exception
+        self.queries = 0
+        self._token = None
+
+    def count(self):
+        self.queries += 1
+        if self.queries == self.max_queries + 1 or (self.raise_exception and self.queries > self.max_queries):
+            message = "Query budget of %d queries exceeded" % self.max_queries
+            if self.raise_exception:
+                raise QueryBudgetExceeded(message)
+
+            warnings.warn(message, RuntimeWarning)
+
+    def __enter__(self):
+        self._token = _query_budget.set(self)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        _query_budget.reset(self._token)
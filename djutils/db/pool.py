@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+
+_logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def _transaction_status(connection) -> int:
+    try:
+        # psycopg 3
+        return int(connection.info.transaction_status)
+
+    except AttributeError:
+        # psycopg2
+        return connection.get_transaction_status()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections (psycopg2 and psycopg 3).
+
+    At most `max_size` connections are open at once, `getconn` waits up to `timeout` seconds for one to be returned.
+    Idle connections are checked with `SELECT 1` on checkout if they have been idle for more than `check_interval`
+    seconds and closed after `max_idle` seconds, keeping at least `min_size` connections open.
+    Connections are only created on demand.
+    """
+
+    def __init__(self, min_size: int = 0, max_size: int = 10, max_idle: float = 300, timeout: float = 30, check_interval: float = 30):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def getconn(self, connect: Callable):
+        """ Check out a connection, `connect` is called to create a new one if no idle connection is available """
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                self._evict_idle()
+                while self._idle:
+                    connection, returned_at = self._idle.pop()
+                    if self._is_healthy(connection, time.monotonic() - returned_at):
+                        return connection
+
+                    self._discard(connection)
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise PoolTimeout("No connection available within %s seconds" % self.timeout)
+
+        try:
+            return connect()
+
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+
+            raise
+
+    def putconn(self, connection, discard: bool = False):
+        """ Return a connection to the pool, broken connections (or with `discard`) are closed instead """
+        if not discard and not connection.closed:
+            try:
+                if _transaction_status(connection) != 0:
+                    connection.rollback()
+
+            except Exception as error:
+                _logger.warning("Discarding connection which cannot be reset: %s", error)
+                discard = True
+
+        with self._condition:
+            if discard or connection.closed:
+                self._discard(connection)
+
+            else:
+                self._idle.append((connection, time.monotonic()))
+
+            self._condition.notify()
+
+    def close(self):
+        """ Close all idle connections """
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.popleft()[0])
+
+    def _is_healthy(self, connection, idle_for: float) -> bool:
+        if connection.closed:
+            return False
+
+        if idle_for < self.check_interval:
+            return True
+
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+
+            finally:
+                cursor.close()
+
+            if not connection.autocommit:
+                connection.rollback()
+
+            return True
+
+        except Exception as error:
+            _logger.info("Discarding broken connection: %s", error)
+            return False
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        # The oldest connections are at the left, as connections are checked out LIFO
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            self._discard(self._idle.popleft()[0])
+
+    def _discard(self, connection):
+        self._size -= 1
+        try:
+            connection.close()
+
+        except Exception as error:
+            _logger.warning(error)
@@ -0,0 +1,82 @@
+"""
+Client-side retries of transactions aborted with a serialization failure (SQLSTATE 40001), as required under
+contention by CockroachDB (and PostgreSQL with `SERIALIZABLE` isolation).
+"""
+
+import logging
+import random
+import time
+from functools import wraps
+from typing import Callable, Optional
+from django.db import DatabaseError, transaction
+from .. import app_settings
+from ..counters import Counters
+
+
+_logger = logging.getLogger(__name__)
+
+SERIALIZATION_FAILURE = '40001'
+
+
+# Transactions retried after a serialization failure and those given up after `max_attempts`
+counters = Counters(retries=0, give_ups=0)
+
+
+def is_serialization_failure(error: Exception) -> bool:
+    while error is not None:
+        # psycopg2 / psycopg 3
+        if (getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)) == SERIALIZATION_FAILURE:
+            return True
+
+        error = error.__cause__
+
+    return False
+
+
+def retrying_atomic(
+    func: Optional[Callable] = None,
+    *,
+    using: Optional[str] = None,
+    max_attempts: int = app_settings.DB_SERIALIZATION_RETRY_MAX_ATTEMPTS,
+    base_delay: float = 0.01,
+    max_delay: float = 1.0,
+):
+    """
+    Like `transaction.atomic` as decorator, but the whole transaction (the decorated function) is retried on
+    serialization failures, up to `max_attempts` times with exponential backoff and full jitter
+    (random delay of up to `base_delay * 2 ** attempt`, capped at `max_delay` seconds).
+    The decorated function must be safe to re-run. Within an already started transaction no retry is possible, so the
+    function is just run in a savepoint and errors are passed on to the outermost `retrying_atomic`.
+    """
+    def wrapper(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if transaction.get_connection(using).in_atomic_block:
+                with transaction.atomic(using=using):
+                    return func(*args, **kwargs)
+
+            attempt = 1
+            while True:
+                try:
+                    with transaction.atomic(using=using):
+                        return func(*args, **kwargs)
+
+                except DatabaseError as error:
+                    if not is_serialization_failure(error):
+                        raise
+
+                    if attempt >= max_attempts:
+                        counters.add(give_ups=1)
+                        _logger.warning("Giving up %s after %d attempts: %s", func, attempt, error)
+                        raise
+
+                    counters.add(retries=1)
+                    time.sleep(random.uniform(0, min(max_delay, base_delay * 2**attempt)))
+                    attempt += 1
+
+        return wrapped
+
+    if func is None:
+        return wrapper
+
+    return wrapper(func)
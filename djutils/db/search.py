@@ -0,0 +1,31 @@
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.db.models import F, QuerySet
+from .functions import LevenshteinLessEqual, TrigramSimilar
+
+
+def fuzzy_search(queryset: QuerySet, field: str, search_term: str, max_distance: int = 2, prefilter: bool = True, annotation: str = 'distance') -> QuerySet:
+    """
+    Filter `queryset` for rows whose `field` is within a Levenshtein distance of `max_distance` to `search_term`,
+    ordered by the distance (annotated as `annotation`).
+
+    With `prefilter` candidates are first narrowed down by trigram similarity, which uses a trigram index on `field`
+    (see `trigram_index`) instead of scanning the table. Very short terms may share too few trigrams to pass the
+    similarity threshold (`pg_trgm.similarity_threshold`), disable `prefilter` for those.
+    Requires the `fuzzystrmatch` and `pg_trgm` extensions (`FuzzystrExtension`, `TrigramExtension`).
+    """
+    if prefilter:
+        queryset = queryset.filter(TrigramSimilar(F(field), search_term))
+
+    return queryset.annotate(**{
+        annotation: LevenshteinLessEqual(F(field), search_term, max_distance),
+    }).filter(**{
+        '%s__lte' % annotation: max_distance,
+    }).order_by(annotation)
+
+
+def trigram_index(*fields: str, name: str, using: str = 'gin'):
+    """ A GIN (or GiST with `using='gist'`) trigram index on `fields`, for use in `Meta.indexes` """
+    if using == 'gist':
+        return GistIndex(fields=fields, name=name, opclasses=['gist_trgm_ops'] * len(fields))
+
+    return GinIndex(fields=fields, name=name, opclasses=['gin_trgm_ops'] * len(fields))
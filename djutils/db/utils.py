@@ -3,15 +3,35 @@ Original code from "olympus", Copyright (C) 2021  LaVita GmbH / Digital Solution
 https://github.com/LaVita-GmbH/olympus
 """
 
+import time
 from django.db.utils import OperationalError
+from . import instrumentation
+from .retry import is_serialization_failure
 
 
 class ReconnectingCursorMixin:
     def _execute_with_wrappers(self, sql, params, many, executor):
+        if not instrumentation.is_active():
+            return self._execute_reconnecting(sql, params, many, executor)
+
+        instrumentation.check_budget()
+        start = time.perf_counter()
+        try:
+            return self._execute_reconnecting(sql, params, many, executor)
+
+        finally:
+            instrumentation.record(sql, time.perf_counter() - start, many)
+
+    def _execute_reconnecting(self, sql, params, many, executor):
         try:
             return super()._execute_with_wrappers(sql, params, many, executor)
 
         except OperationalError as error:
+            if is_serialization_failure(error):
+                # The transaction has been aborted, it has to be retried as a whole (see `retrying_atomic`)
+                raise
+
+            instrumentation.counters.add(retries=1)
             self.db._reconnect()
             self.cursor.close()
             self.cursor = self.db.create_cursor()
@@ -1,11 +1,31 @@
+import ipaddress
+import json
+import mimetypes
+import os
+from functools import lru_cache
+from asgiref.sync import iscoroutinefunction
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, Optional, Union
 from django.utils.translation import gettext_lazy as _
-from django.http import HttpResponse, HttpResponseRedirect, Http404, JsonResponse
-from django.core.exceptions import ValidationError
-from django.contrib.staticfiles.views import serve
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
 from .exceptions import Error
+from .ip import NetworkMatcher
 from . import app_settings
 
+try:
+    import orjson
+
+except ImportError:
+    orjson = None
+
+
+_django_json_encoder = DjangoJSONEncoder()
 
 def redirect(to):
     """ A simple static redirect for use in the urlpatterns preserving GET parameters """
@@ -13,9 +33,78 @@ def redirect(to):
         return HttpResponseRedirect(redirect_to=to+('?' + request.GET.urlencode(safe='/') if request.GET else ''))
     return redir
 
-def static_file(file):
+class StaticFile:
+    """
+    A single static file, served with `ETag`/`Last-Modified` and answered with 304 for conditional requests.
+    Files up to `cache_max_size` bytes are kept in memory until their mtime changes, larger files are sent as
+    `FileResponse` (allowing the server's file wrapper / sendfile to be used). With `HTTP_STATIC_FILE_SENDFILE_HEADER`
+    set to `X-Accel-Redirect` (nginx) or `X-Sendfile` (Apache, lighttpd) sending is delegated to the web server.
+    """
+
+    def __init__(self, file, cache_max_size=app_settings.HTTP_STATIC_FILE_CACHE_MAX_SIZE):
+        self.file = file
+        self.cache_max_size = cache_max_size
+        self.content_type = mimetypes.guess_type(file)[0] or 'application/octet-stream'
+        self._path = None
+        self._cached = (None, None)
+
+    @property
+    def path(self):
+        if self._path is None:
+            path = finders.find(self.file)
+            if not path:
+                try:
+                    if staticfiles_storage.exists(self.file):
+                        path = staticfiles_storage.path(self.file)
+                except ImproperlyConfigured:
+                    pass
+            if not path:
+                raise Http404('"%s" could not be found' % self.file)
+            self._path = path
+        return self._path
+
+    def serve(self, request):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._path = None
+            raise Http404('"%s" could not be found' % self.file)
+
+        etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+        last_modified = int(stat.st_mtime)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self._get_response(stat)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _get_response(self, stat):
+        sendfile_header = app_settings.HTTP_STATIC_FILE_SENDFILE_HEADER
+        if sendfile_header:
+            response = HttpResponse(content_type=self.content_type)
+            if sendfile_header.lower() == 'x-accel-redirect':
+                response[sendfile_header] = app_settings.HTTP_STATIC_FILE_SENDFILE_URL + self.file
+            else:
+                response[sendfile_header] = self.path
+            return response
+
+        if stat.st_size > self.cache_max_size:
+            return FileResponse(open(self.path, 'rb'), content_type=self.content_type)
+
+        key, content = self._cached
+        if key != (stat.st_mtime_ns, stat.st_size):
+            with open(self.path, 'rb') as file:
+                content = file.read()
+            self._cached = ((stat.st_mtime_ns, stat.st_size), content)
+        return HttpResponse(content, content_type=self.content_type)
+
+def static_file(file, cache_max_size=app_settings.HTTP_STATIC_FILE_CACHE_MAX_SIZE):
+    """ A view serving the static file `file` (e.g. `robots.txt`), see `StaticFile` """
+    static = StaticFile(file, cache_max_size=cache_max_size)
     def serve_static(request):
-        return serve(request, file)
+        return static.serve(request)
     return serve_static
 
 def h404(request):
@@ -26,9 +115,129 @@ def get_ip_address(request):
     """
     Get the remote address of the client.
     Using the `X-Forwarded-For` Header field if set or the regular `REMOTE_ADDR`.
+    The header is returned as is and may be spoofed, use `get_client_ip` if the client address is to be trusted.
     """
     return request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('REMOTE_ADDR')
 
+def json_dumps(data) -> bytes:
+    """
+    Encode `data` as JSON using `DjangoJSONEncoder`.
+    With `HTTP_JSON_FAST_ENCODER` enabled and orjson installed, orjson is used instead. Types which are not native to
+    JSON (including datetimes) are still encoded by `DjangoJSONEncoder`, but the output is compact (no spaces after
+    separators) and non-ASCII characters are not escaped. Data orjson cannot encode (e.g. integers exceeding 64 bit)
+    falls back to `json.dumps`.
+    """
+    if orjson and app_settings.HTTP_JSON_FAST_ENCODER:
+        try:
+            return orjson.dumps(
+                data,
+                default=_django_json_encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except orjson.JSONEncodeError:
+            pass
+
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+def json_response(data, status=200) -> HttpResponse:
+    """ Like `JsonResponse(data, safe=False)`, using `json_dumps` """
+    return HttpResponse(json_dumps(data), content_type='application/json', status=status)
+
+def stream_json_array(items: Iterable, buffer_size=65536) -> Iterator[bytes]:
+    """ Encode `items` as JSON array incrementally, in chunks of about `buffer_size` bytes """
+    buffer = [b'[']
+    length = 1
+    for i, item in enumerate(items):
+        data = json_dumps(item)
+        if i:
+            buffer.append(b',')
+
+        buffer.append(data)
+        length += len(data) + 1
+        if length >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+async def astream_json_array(items: AsyncIterable, buffer_size=65536) -> AsyncIterator[bytes]:
+    """ Async variant of `stream_json_array` """
+    buffer = [b'[']
+    length = 1
+    first = True
+    async for item in items:
+        data = json_dumps(item)
+        if not first:
+            buffer.append(b',')
+
+        first = False
+        buffer.append(data)
+        length += len(data) + 1
+        if length >= buffer_size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+
+    buffer.append(b']')
+    yield b''.join(buffer)
+
+def streaming_json_response(items: Union[Iterable, AsyncIterable], status=200) -> StreamingHttpResponse:
+    """ Respond with a JSON array which is encoded while being sent, `items` may also be an async iterable """
+    if isinstance(items, AsyncIterable):
+        content = astream_json_array(items)
+    else:
+        content = stream_json_array(items)
+    return StreamingHttpResponse(content, content_type='application/json', status=status)
+
+class ClientIPResolver:
+    """
+    Resolves the client address of a request behind trusted proxies.
+    The `X-Forwarded-For` chain (followed by `REMOTE_ADDR`) is walked right-to-left, skipping addresses of
+    `trusted_proxies`; the first untrusted address is the client. Entries left of it are ignored, as they can be
+    spoofed by the client. If an unparsable entry is reached before an untrusted address, the client cannot be
+    determined and `None` is returned. Recent resolutions are kept in a LRU cache of `cache_size` entries.
+    """
+
+    def __init__(self, trusted_proxies=app_settings.HTTP_TRUSTED_PROXIES, cache_size=1024):
+        self.trusted_proxies = NetworkMatcher(trusted_proxies)
+        self._resolve = lru_cache(maxsize=cache_size)(self._resolve_chain)
+
+    def _resolve_chain(self, remote_addr, forwarded_for):
+        chain = [address.strip() for address in forwarded_for.split(',')] if forwarded_for else []
+        chain.append(remote_addr)
+        client = None
+        for address in reversed(chain):
+            try:
+                address = ipaddress.ip_address(address)
+            except ValueError:
+                # A malformed entry reached through trusted proxies, the client cannot be determined
+                return None
+            client = address
+            if address not in self.trusted_proxies:
+                break
+        return client
+
+    def resolve(self, request) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+        """ The client address of `request` or `None` if it cannot be determined """
+        return self._resolve(request.META.get('REMOTE_ADDR') or '', request.META.get('HTTP_X_FORWARDED_FOR') or '')
+
+    def cache_clear(self):
+        self._resolve.cache_clear()
+
+_client_ip_resolver = None
+
+def get_client_ip(request) -> Optional[Union[ipaddress.IPv4Address, ipaddress.IPv6Address]]:
+    """
+    Get the address of the client, honouring `X-Forwarded-For` only for the proxies in `HTTP_TRUSTED_PROXIES`.
+    See `ClientIPResolver`.
+    """
+    global _client_ip_resolver
+    if _client_ip_resolver is None:
+        _client_ip_resolver = ClientIPResolver()
+    return _client_ip_resolver.resolve(request)
+
 def error_respond_json(error, status_code):
     response = {
         'message': None,
@@ -52,7 +261,7 @@ def error_respond_json(error, status_code):
         response['code'] = error.args[1] if len(error.args) > 1 else None
         status_code = 400 if isinstance(error, AssertionError) else status_code
 
-    return JsonResponse(
+    return json_response(
         {
             "error": response
         } if app_settings.HTTP_ERROR_WRAP_IN_ERROR_DICT else response,
@@ -65,6 +274,14 @@ def exceptions_to_http(*exceptions, status_code=403):
     A `AssertionError` will resolve with HTTP Status code 400
     """
     def wrap_function(f):
+        if iscoroutinefunction(f):
+            async def async_wrapper(*args, **kwargs):
+                try:
+                    return await f(*args, **kwargs)
+                except exceptions as error:
+                    return error_respond_json(error, status_code)
+            return async_wrapper
+
         def wrapper(*args, **kwargs):
             try:
                 return f(*args, **kwargs)
@@ -74,10 +291,23 @@ def exceptions_to_http(*exceptions, status_code=403):
     return wrap_function
 
 def respond_json(f):
-    """ Converts the returned data into a `JsonResponse` """
+    """
+    Converts the returned data into a JSON response.
+    Generators and other iterators are streamed as JSON array (`StreamingHttpResponse`).
+    Works for sync and async views; async views may also return async iterators.
+    """
+    if iscoroutinefunction(f):
+        async def async_wrapper(*args, **kwargs):
+            return _to_json_response(await f(*args, **kwargs))
+        return async_wrapper
+
     def wrapper(*args, **kwargs):
-        ret = f(*args, **kwargs)
-        if not isinstance(ret, HttpResponse):
-            ret = JsonResponse(ret, safe=False)
-        return ret
+        return _to_json_response(f(*args, **kwargs))
     return wrapper
+
+def _to_json_response(ret):
+    if isinstance(ret, (Iterator, AsyncIterator)):
+        return streaming_json_response(ret)
+    if not isinstance(ret, (HttpResponse, StreamingHttpResponse)):
+        return json_response(ret)
+    return ret
@@ -1,4 +1,10 @@
 import ipaddress
+from bisect import bisect_right
+from functools import lru_cache
+from typing import IO, Iterable, Iterator, Union
+
+IPV4_MASK = 0xFFFFFFFF ^ 0xFF
+IPV6_MASK = (1 << 128) - 1 ^ (1 << 72) - 1
 
 def mask_ip_address(ip_address):
     """
@@ -10,3 +16,72 @@ def mask_ip_address(ip_address):
     """
     ip_address = ipaddress.ip_network(ip_address)
     return str(ip_address.supernet(prefixlen_diff=8 if isinstance(ip_address, ipaddress.IPv4Network) else 72).network_address)
+
+
+def _mask_ip_address_int(ip_address: str) -> str:
+    """ `mask_ip_address` for plain addresses using integer bit operations """
+    ip_address = ip_address.strip()
+    if '/' in ip_address:
+        return mask_ip_address(ip_address)
+
+    ip_address = ipaddress.ip_address(ip_address)
+    if ip_address.version == 4:
+        return str(ipaddress.IPv4Address(int(ip_address) & IPV4_MASK))
+
+    return str(ipaddress.IPv6Address(int(ip_address) & IPV6_MASK))
+
+
+def mask_ip_addresses(ip_addresses: Iterable[str], cache_size: int = 65536) -> Iterator[str]:
+    """
+    Bulk variant of `mask_ip_address`, streams over `ip_addresses`.
+    Results are memoized in a LRU cache of `cache_size` entries, as addresses tend to repeat (e.g. in access logs).
+    """
+    mask = lru_cache(maxsize=cache_size)(_mask_ip_address_int)
+    for ip_address in ip_addresses:
+        yield mask(ip_address)
+
+
+def mask_ip_addresses_file(file: IO[str], cache_size: int = 65536) -> Iterator[str]:
+    """ Mask a file (object) containing one IP-Address per line, empty lines are skipped """
+    return mask_ip_addresses((line for line in file if line.strip()), cache_size=cache_size)
+
+
+def mask_ipv4_array(ip_addresses):
+    """
+    Mask an array of IPv4 addresses given as integers (NumPy `uint32` array or anything convertible to it) at once.
+    Requires NumPy.
+    """
+    import numpy
+
+    return numpy.asarray(ip_addresses, dtype=numpy.uint32) & numpy.uint32(IPV4_MASK)
+
+
+def mask_ip_address_column(queryset, field_name: str) -> int:
+    """
+    Mask the IP-Addresses in column `field_name` of all rows in `queryset` with a single `UPDATE`, calculated by the
+    database (PostgreSQL) instead of passing the rows through Python. Returns the number of updated rows.
+    """
+    from .db.functions import MaskIPAddress
+
+    return queryset.exclude(**{'%s__isnull' % field_name: True}).update(**{field_name: MaskIPAddress(field_name)})
+
+
+class NetworkMatcher:
+    """
+    Precompiled matcher for a set of networks (CIDR notation or `ipaddress` networks).
+    The networks are collapsed into sorted integer ranges per IP version, so a lookup is a binary search.
+    """
+
+    def __init__(self, networks: Iterable[Union[str, ipaddress.IPv4Network, ipaddress.IPv6Network]]):
+        networks = [ipaddress.ip_network(network) for network in networks]
+        self._ranges = {}
+        for version in (4, 6):
+            collapsed = ipaddress.collapse_addresses(network for network in networks if network.version == version)
+            ranges = [(int(network.network_address), int(network.broadcast_address)) for network in collapsed]
+            self._ranges[version] = ([start for start, _ in ranges], [end for _, end in ranges])
+
+    def __contains__(self, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+        starts, ends = self._ranges[address.version]
+        value = int(address)
+        i = bisect_right(starts, value) - 1
+        return i >= 0 and value <= ends[i]
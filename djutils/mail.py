@@ -1,21 +1,187 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from functools import lru_cache, partial
+from typing import Callable, Iterable, List, Tuple
 from django.core import mail
+from django.db import transaction
 from django.conf import settings
 from django.utils.html import strip_tags
 from django.template.loader import get_template
+from . import app_settings
 
-def format_mail_message(template, subject, context):
+
+_logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """
+    In-process queue for sending mails in the background, served by a pool of `workers` daemon threads.
+    Failed sends are retried `max_retries` times with exponential backoff starting at `retry_backoff` seconds.
+    The queue is bounded by `max_size`; when it is full, `put` blocks for up to `put_timeout` seconds and then raises
+    `queue.Full`. Pending mails are flushed when the interpreter exits.
+    """
+
+    def __init__(
+        self,
+        workers=app_settings.MAIL_QUEUE_WORKERS,
+        max_size=app_settings.MAIL_QUEUE_MAX_SIZE,
+        max_retries=app_settings.MAIL_QUEUE_MAX_RETRIES,
+        retry_backoff=app_settings.MAIL_QUEUE_RETRY_BACKOFF,
+        put_timeout=app_settings.MAIL_QUEUE_PUT_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(max_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='djutils-mail-%d' % i, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+            atexit.register(self.shutdown)
+
+    def put(self, send: Callable, *args, **kwargs):
+        """ Enqueue the call `send(*args, **kwargs)` """
+        self._start()
+        self._queue.put((send, args, kwargs), timeout=self.put_timeout)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+
+                self._send(*item)
+
+            finally:
+                self._queue.task_done()
+
+    def _send(self, send, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                send(*args, **kwargs)
+                return
+
+            except Exception as error:
+                if attempt >= self.max_retries:
+                    _logger.exception("Sending mail failed after %d attempts: %s", attempt + 1, error)
+                    return
+
+                _logger.warning("Sending mail failed, retrying: %s", error)
+                time.sleep(self.retry_backoff * 2**attempt)
+
+    def flush(self):
+        """ Block until all enqueued mails are processed """
+        self._queue.join()
+
+    def shutdown(self):
+        """ Flush the queue and stop the workers """
+        with self._lock:
+            threads, self._threads = self._threads, []
+
+        for _ in threads:
+            self._queue.put(None)
+
+        for thread in threads:
+            thread.join()
+
+
+mail_queue = MailQueue()
+
+
+def _put_mail(send: Callable, kwargs: dict):
+    try:
+        mail_queue.put(send, **kwargs)
+
+    except queue.Full:
+        # May run after commit, so the mail is sent inline instead of failing the committed request
+        _logger.warning("Mail queue is full, sending mail inline")
+        try:
+            send(**kwargs)
+
+        except Exception as error:
+            _logger.exception("Sending mail failed: %s", error)
+
+
+def _enqueue_mail(send: Callable, **kwargs):
+    """ Enqueue the mail once the current transaction (if any) is committed, works in sync and async contexts """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        connection.on_commit(partial(_put_mail, send, kwargs))
+
+    else:
+        _put_mail(send, kwargs)
+
+
+def _render_mail_message(template, subject, context):
     context.update({
         'subject': subject,
         'title': settings.TITLE,
         'http_host': settings.BASE_HTTP_HOST,
         'css': context.get('css'),
     })
-    return get_template('mail/'+template).render(context)
+    return template.render(context)
+
+def format_mail_message(template, subject, context):
+    return _render_mail_message(get_template('mail/'+template), subject=subject, context=context)
+
+def _send(queued, send, **kwargs):
+    """
+    Call `send` directly or enqueue it in `mail_queue`.
+    Queued mails are only enqueued once the current transaction is committed, so mails of rolled back transactions
+    are never sent.
+    """
+    if not queued:
+        return send(**kwargs)
 
-def send_mail(subject, template, context, recipient_list, fail_silently=False):
+    _enqueue_mail(send, **kwargs)
+
+def send_mail(subject, template, context, recipient_list, fail_silently=False, queued=app_settings.MAIL_QUEUED):
+    """ Send a templated mail, with `queued` it is sent in the background by `mail_queue` and `None` is returned """
     message = format_mail_message(template=template, subject=subject, context=context)
-    return mail.send_mail(subject=subject, message=strip_tags(message), html_message=message, from_email=settings.EMAIL_HOST_USER, recipient_list=recipient_list, fail_silently=fail_silently)
+    return _send(queued, mail.send_mail, subject=subject, message=strip_tags(message), html_message=message, from_email=settings.EMAIL_HOST_USER, recipient_list=recipient_list, fail_silently=fail_silently)
 
-def mail_admins(subject, template, context, fail_silently=False):
+def mail_admins(subject, template, context, fail_silently=False, queued=app_settings.MAIL_QUEUED):
+    """ Send a templated mail to the admins, with `queued` it is sent in the background by `mail_queue` """
     message = format_mail_message(template=template, subject=subject, context=context)
-    return mail.mail_admins(subject=subject, message=strip_tags(message), html_message=message, fail_silently=fail_silently)
+    return _send(queued, mail.mail_admins, subject=subject, message=strip_tags(message), html_message=message, fail_silently=fail_silently)
+
+def send_mass_templated_mail(subject, template, messages: Iterable[Tuple[dict, List[str]]], batch_size=100, fail_silently=False, connection=None):
+    """
+    Send the template `template` to many recipients, `messages` is an iterable of `(context, recipient_list)`.
+    The template is loaded once and all mails are sent through one connection in batches of `batch_size`
+    (`send_messages`). The plaintext part is derived once per distinct rendered HTML.
+    Returns the number of sent mails.
+    """
+    compiled_template = get_template('mail/'+template)
+    to_plaintext = lru_cache(maxsize=128)(strip_tags)
+    connection = connection or mail.get_connection(fail_silently=fail_silently)
+    sent = 0
+    with connection:
+        batch = []
+        for context, recipient_list in messages:
+            message = _render_mail_message(compiled_template, subject=subject, context=context)
+            email = mail.EmailMultiAlternatives(subject=subject, body=to_plaintext(message), from_email=settings.EMAIL_HOST_USER, to=recipient_list, connection=connection)
+            email.attach_alternative(message, 'text/html')
+            batch.append(email)
+            if len(batch) >= batch_size:
+                sent += connection.send_messages(batch) or 0
+                batch = []
+
+        if batch:
+            sent += connection.send_messages(batch) or 0
+
+    return sent
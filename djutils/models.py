@@ -1,50 +1,276 @@
+import logging
 import os.path
-from typing import Any
+import shutil
+from typing import Any, Dict, Iterator, List, Optional
 import uuid
 import hashlib
 import subprocess
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
 from io import BytesIO
+from functools import lru_cache
 from PIL import Image
 from django.db import models
-from django.db.models import Func, Value, CharField, JSONField
+from django.db.models import Func, Value, BooleanField, CharField, JSONField, prefetch_related_objects
 from django.db.transaction import atomic
 from django.db.models.fields.files import FieldFile
+from django.core.exceptions import FieldDoesNotExist
+from django.core.files.base import File
 from django.core.files.storage import FileSystemStorage
-from django.utils.crypto import get_random_string
 from django.utils.deconstruct import deconstructible
+from .crypt import RANDOM_STRING_CHARS, RandomStringGenerator, get_random_string_generator
+from . import app_settings
+
+
+_logger = logging.getLogger(__name__)
+
+
+def _convert_value(value):
+    if isinstance(value, datetime):
+        value = value.timestamp()
+    elif isinstance(value, uuid.UUID):
+        value = str(value)
+    elif isinstance(value, models.Manager):
+        value = [model_to_dict(related) for related in value.all()]
+    elif isinstance(value, FieldFile):
+        value = value.url
+    elif isinstance(value, models.Model):
+        value = _convert_model(value)
+
+    return value
+
+
+def _convert_model(value):
+    try:
+        return getattr(value, "values")()
+    except AttributeError:
+        return value
+
+
+def _convert_related_model(value):
+    return _convert_model(value) if value is not None else None
+
+
+def _convert_datetime(value):
+    return value.timestamp() if value is not None else None
+
+
+def _convert_uuid(value):
+    return str(value) if value is not None else None
+
+
+def _convert_file(value):
+    return value.url
+
+
+def _convert_identity(value):
+    return value
+
+
+def _is_attname(field, name: str) -> bool:
+    return name != field.name and getattr(field, 'attname', None) == name
+
+
+class SerializerPlan:
+    """
+    Compiled `model_to_dict` for a model: the field list and a converter per field are resolved once.
+    Use `get_serializer_plan` to get a cached plan.
+    """
+
+    def __init__(self, model, fields: tuple = (), exclude: tuple = ()):
+        self.model = model
+        self.fields = []
+        self.select_related = []
+        self.prefetch_related = []
+        for name in fields or [field.name for field in model._meta.get_fields()]:
+            if name in exclude:
+                continue
+
+            self.fields.append((name, self._compile_field(name)))
+
+        self.values_only = all(self._is_values_field(name) for name, _ in self.fields)
+
+    def _is_values_field(self, name) -> bool:
+        """ Whether the field can be serialized from the `values()` of a queryset, without model instance """
+        try:
+            field = self.model._meta.get_field(name)
+
+        except FieldDoesNotExist:
+            return False
+
+        if _is_attname(field, name):
+            return True
+
+        return field.concrete and not field.is_relation and not isinstance(field, models.FileField)
+
+    def _compile_field(self, name):
+        try:
+            field = self.model._meta.get_field(name)
+
+        except FieldDoesNotExist:
+            return _convert_value
+
+        if _is_attname(field, name):
+            # The column of a foreign key (e.g. `author_id`), a plain value
+            return _convert_identity
+
+        if field.is_relation and field.related_model:
+            if field.one_to_many or field.many_to_many:
+                self.prefetch_related.append((name, field.related_model))
+                return self._compile_related_manager(field.related_model)
+
+            if field.many_to_one or field.one_to_one:
+                self.select_related.append(name)
+                return _convert_related_model
+
+        if field.is_relation:
+            return _convert_value
+
+        if isinstance(field, models.DateTimeField):
+            return _convert_datetime
+
+        if isinstance(field, models.UUIDField):
+            return _convert_uuid
+
+        if isinstance(field, models.FileField):
+            return _convert_file
+
+        if type(field).__module__.startswith('django.'):
+            return _convert_identity
+
+        return _convert_value
+
+    @staticmethod
+    def _compile_related_manager(related_model):
+        def convert(value):
+            plan = get_serializer_plan(related_model)
+            return [plan.to_dict(related) for related in value.all()]
+
+        return convert
+
+    def to_dict(self, instance) -> dict:
+        return {name: convert(getattr(instance, name)) for name, convert in self.fields}
+
+    def values_to_dict(self, values: dict) -> dict:
+        return {name: convert(values[name]) for name, convert in self.fields}
+
+    def get_related_lookups(self, prefix: str = '', seen: tuple = ()):
+        """
+        The `select_related` and `prefetch_related` lookups for all relations traversed by this plan.
+        Relations below a prefetched relation are prefetched as well.
+        """
+        select_related = []
+        prefetch_related = []
+        for name in self.select_related:
+            (prefetch_related if prefix else select_related).append(prefix + name)
+
+        for name, related_model in self.prefetch_related:
+            prefetch_related.append(prefix + name)
+            if related_model is self.model or related_model in seen:
+                continue
+
+            _, nested = get_serializer_plan(related_model).get_related_lookups(
+                '%s%s__' % (prefix, name),
+                seen + (self.model,),
+            )
+            prefetch_related += nested
+
+        return select_related, prefetch_related
+
+    def prepare(self, queryset):
+        """ Apply the `select_related` and `prefetch_related` lookups to `queryset` """
+        select_related, prefetch_related = self.get_related_lookups()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+
+        return queryset
+
+
+@lru_cache(maxsize=None)
+def get_serializer_plan(model, fields: tuple = (), exclude: tuple = ()) -> SerializerPlan:
+    return SerializerPlan(model, fields=fields, exclude=exclude)
 
 
 def model_to_dict(instance, fields: list = [], exclude: list = []):
-    if not fields:
-        fields = [field.name for field in instance._meta.get_fields()]
-    data = {}
-    for field in fields:
-        if field in exclude:
-            continue
-
-        value = getattr(instance, field)
-        if isinstance(value, datetime):
-            value = value.timestamp()
-        elif isinstance(value, uuid.UUID):
-            value = str(value)
-        elif isinstance(value, models.Manager):
-            value = [model_to_dict(related) for related in value.all()]
-        elif isinstance(value, FieldFile):
-            value = value.url
-        elif isinstance(value, models.Model):
-            try:
-                value = getattr(value, "values")()
-            except AttributeError:
-                pass
+    return get_serializer_plan(type(instance), tuple(fields), tuple(exclude)).to_dict(instance)
+
+
+def queryset_to_list(queryset, fields: list = [], exclude: list = []) -> List[dict]:
+    """
+    `model_to_dict` for all objects of `queryset`.
+    Relations which are traversed are loaded with `select_related`/`prefetch_related` instead of one query per object.
+    """
+    plan = get_serializer_plan(queryset.model, tuple(fields), tuple(exclude))
+    return [plan.to_dict(instance) for instance in plan.prepare(queryset)]
+
+
+def queryset_to_dicts(
+    queryset,
+    fields: list = [],
+    exclude: list = [],
+    chunk_size: int = 2000,
+    use_values: Optional[bool] = None,
+) -> Iterator[dict]:
+    """
+    Streaming `queryset_to_list`, yields one dict at a time so memory is bounded by `chunk_size`.
+    Objects are fetched with `QuerySet.iterator()` and related managers are prefetched per chunk.
+    If all fields can be serialized from plain column values (no relations, files or model attributes), the model
+    instances are skipped by using `values()`; `use_values` forces or disables this.
+    """
+    plan = get_serializer_plan(queryset.model, tuple(fields), tuple(exclude))
+    if use_values is None:
+        use_values = plan.values_only
+
+    if use_values:
+        for values in queryset.values(*(name for name, _ in plan.fields)).iterator(chunk_size=chunk_size):
+            yield plan.values_to_dict(values)
+
+        return
+
+    select_related, prefetch_related = plan.get_related_lookups()
+    prefetch_related = [*queryset._prefetch_related_lookups, *prefetch_related]
+    if select_related:
+        queryset = queryset.select_related(*select_related)
 
-        data[field] = value
+    chunk = []
+    for instance in queryset.prefetch_related(None).iterator(chunk_size=chunk_size):
+        chunk.append(instance)
+        if len(chunk) >= chunk_size:
+            yield from _serialize_chunk(plan, chunk, prefetch_related)
+            chunk = []
 
-    return data
+    yield from _serialize_chunk(plan, chunk, prefetch_related)
+
+
+def _serialize_chunk(plan: SerializerPlan, chunk: list, prefetch_related: list) -> Iterator[dict]:
+    if prefetch_related and chunk:
+        prefetch_related_objects(chunk, *prefetch_related)
+
+    for instance in chunk:
+        yield plan.to_dict(instance)
+
+
+_mozjpeg_slots = threading.BoundedSemaphore(app_settings.MOZJPEG_MAX_IN_FLIGHT)
+
+
+@lru_cache(maxsize=None)
+def _which(command: str) -> Optional[str]:
+    return shutil.which(command)
 
 
 @deconstructible
 class MozJPEGPostprocessor:
+    """
+    Compresses JPEGs with the `mozjpeg` binary, `args` are passed to it.
+    At most `MOZJPEG_MAX_IN_FLIGHT` processes run at once (per process), calls wait up to `MOZJPEG_QUEUE_TIMEOUT`
+    seconds for a free slot. If the binary is missing or no slot became free, the image is re-encoded by Pillow as
+    optimized progressive JPEG keeping its quality settings, or `TimeoutError` is raised with `fallback=False`.
+    """
+
     def __init__(self, *args, **kwargs):
         self.args = args
         self.kwargs = kwargs
@@ -53,23 +279,64 @@ class MozJPEGPostprocessor:
         return self.process(file, *self.args, **self.kwargs)
 
     @classmethod
-    def process(cls, file: BytesIO, *args, timeout=10):
-        mozjpeg = subprocess.Popen(['mozjpeg', *args], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    def process(cls, file: BytesIO, *args, timeout=10, queue_timeout=app_settings.MOZJPEG_QUEUE_TIMEOUT, fallback=True):
+        if not _which('mozjpeg'):
+            if not fallback:
+                raise FileNotFoundError('mozjpeg')
+
+            return cls.fallback(file)
+
+        if not _mozjpeg_slots.acquire(timeout=queue_timeout):
+            if not fallback:
+                raise TimeoutError
+
+            _logger.info("No mozjpeg slot available within %s seconds, using fallback", queue_timeout)
+            return cls.fallback(file)
+
         try:
-            stdout, stderr = mozjpeg.communicate(file.getvalue(), timeout=timeout)
+            mozjpeg = subprocess.Popen(['mozjpeg', *args], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            try:
+                if hasattr(file, 'getbuffer'):
+                    with file.getbuffer() as buffer:
+                        stdout, stderr = mozjpeg.communicate(buffer, timeout=timeout)
+
+                else:
+                    file.seek(0)
+                    stdout, stderr = mozjpeg.communicate(file.read(), timeout=timeout)
 
-        except subprocess.TimeoutExpired:
-            mozjpeg.kill()
-            raise TimeoutError
+            except subprocess.TimeoutExpired:
+                mozjpeg.kill()
+                mozjpeg.wait()
+                raise TimeoutError
+
+        finally:
+            _mozjpeg_slots.release()
 
         if stderr:
             raise IOError(stderr)
 
         return BytesIO(stdout)
 
+    @classmethod
+    def fallback(cls, file: BytesIO) -> BytesIO:
+        """ Re-encode the JPEG `file` with Pillow as optimized progressive JPEG, keeping its quantization tables """
+        file.seek(0)
+        image = Image.open(file)
+        output = BytesIO()
+        image.save(
+            output,
+            format='JPEG',
+            quality='keep',
+            subsampling='keep',
+            optimize=True,
+            progressive=True,
+            icc_profile=image.info.get('icc_profile'),
+        )
+        return output
+
 
 class AbstractImageStorage(FileSystemStorage):
-    def __init__(self, *args, resize_to: tuple = None, resample=Image.BICUBIC, output_format='png', just_hash=False, hash_algo=hashlib.sha256, post_process=None, should_fix_colorspace=True, **kwargs):
+    def __init__(self, *args, resize_to: tuple = None, resample=Image.BICUBIC, output_format='png', just_hash=False, hash_algo=hashlib.sha256, post_process=None, should_fix_colorspace=True, max_pixels: Optional[int] = app_settings.IMAGE_MAX_PIXELS, reducing_gap: Optional[float] = 2.0, **kwargs):
         """
         Image Storage.
         Resamples an Image before storing as File.
@@ -80,6 +347,8 @@ class AbstractImageStorage(FileSystemStorage):
         output_format: Image Format (png, jpg, gif, etc.)
         just_hash: Return only the file hash (file basename without extension) instead of the full storage location path
         post_process: callable for additional processing after self.process_picture(); intended to be used for compression, passes the file (BytesIO) as argument
+        max_pixels: Images with more pixels are rejected (`PIL.Image.DecompressionBombError`) before being decoded, `None` (default: `IMAGE_MAX_PIXELS`, unset) leaves the limit to Pillow (`Image.MAX_IMAGE_PIXELS`)
+        reducing_gap: JPEGs are decoded in draft mode and other images reduced (`PIL.Image.reduce`) to at least `reducing_gap` times the target size before resampling, `None` to always resample the full image
         """
         super().__init__(*args, **kwargs)
         self.resize_to = resize_to
@@ -89,10 +358,50 @@ class AbstractImageStorage(FileSystemStorage):
         self.hash_algo = hash_algo
         self.post_process = post_process
         self.should_fix_colorspace = should_fix_colorspace
+        self.max_pixels = max_pixels
+        self.reducing_gap = reducing_gap
+
+    def open_image(self, file) -> Image.Image:
+        """ Open `file` without decoding it, checking the size given in its header against `max_pixels` """
+        image = Image.open(file)
+        if self.max_pixels and image.size[0] * image.size[1] > self.max_pixels:
+            raise Image.DecompressionBombError(
+                "Image size (%d pixels) exceeds limit of %d pixels" % (image.size[0] * image.size[1], self.max_pixels)
+            )
+
+        return image
+
+    def draft(self, image: Image.Image, size: tuple) -> Image.Image:
+        """ Let JPEGs be decoded at the smallest scale of at least `reducing_gap` times `size`, no-op for other formats """
+        if self.reducing_gap:
+            image.draft(None, (int(size[0] * self.reducing_gap), int(size[1] * self.reducing_gap)))
+
+        return image
 
     def process_picture(self, file):
+        """ Process the incomming file, returns Image object """
+        return self.process_image(self.open_image(file))
+
+    def process_image(self, image: Image.Image) -> Image.Image:
         raise NotImplementedError
 
+    def target_size(self, size: tuple) -> tuple:
+        """ Size to which an image of `size` is scaled by `process_image` (before cropping) """
+        return self.resize_to
+
+    def encode(self, image: Image.Image) -> BytesIO:
+        """ Encode the processed `image` in the output format and apply `post_process` """
+        if self.should_fix_colorspace:
+            image = self._fix_colorspace(image, "RGB", self.format.upper())
+
+        file = BytesIO()
+        image.save(file, format=self.format)
+
+        if self.post_process:
+            file = self.post_process(file)
+
+        return file
+
     @classmethod
     def _fix_colorspace(cls, image, colorspace, output_format):
         """
@@ -126,23 +435,20 @@ class AbstractImageStorage(FileSystemStorage):
         return image
 
     def _save(self, name, content):
-        file = BytesIO()
-        content.image = self.process_picture(content.file)
-        if self.should_fix_colorspace:
-            content.image = self._fix_colorspace(content.image, "RGB", self.format.upper())
+        if isinstance(content, RenderedImage):
+            file = content.file
+            hash_name = content.hexdigest
 
-        content.image.save(file, format=self.format)
-
-        if self.post_process:
-            file = self.post_process(file)
-
-        file.seek(0)
+        else:
+            content.image = self.process_picture(content.file)
+            file = self.encode(content.image)
+            hash_name = None
 
         if self.hash_algo:
-            hash_name = self.hash_algo(file.read()).hexdigest()
-            file.seek(0)
+            hash_name = hash_name or self._hexdigest(file)
             name = os.path.join(os.path.dirname(name), "%s.%s" % (hash_name, self.format))
 
+        file.seek(0)
         content.file.seek(0)
         content.file = file
 
@@ -152,15 +458,32 @@ class AbstractImageStorage(FileSystemStorage):
 
         return ret
 
+    def _hexdigest(self, file) -> str:
+        """ Hash the encoded image in place (without copying the buffer) """
+        if hasattr(file, 'getbuffer'):
+            with file.getbuffer() as buffer:
+                return self.hash_algo(buffer).hexdigest()
+
+        file.seek(0)
+        hasher = self.hash_algo()
+        for chunk in iter(lambda: file.read(65536), b''):
+            hasher.update(chunk)
+
+        return hasher.hexdigest()
+
 
 class CroppedImageStorage(AbstractImageStorage):
     """
     Image, resized and cropped to a square
     """
 
-    def process_picture(self, file):
-        """ Process the incomming file, returns Image object """
-        image = Image.open(file)
+    def target_size(self, size: tuple) -> tuple:
+        scale = max(self.resize_to) / min(size)
+        return (size[0] * scale, size[1] * scale)
+
+    def process_image(self, image):
+        # Decode JPEGs close to the size needed for the square crop
+        self.draft(image, self.target_size(image.size))
         # Crop image to a square
         box = (
             (image.size[0] - image.size[1]) / 2,
@@ -175,7 +498,7 @@ class CroppedImageStorage(AbstractImageStorage):
                 image.size[0],
                 image.size[1] - (image.size[1] - image.size[0]) / 2,
             )
-        image = image.resize(self.resize_to, resample=self.resample, box=box)
+        image = image.resize(self.resize_to, resample=self.resample, box=box, reducing_gap=self.reducing_gap)
         return image
 
 
@@ -184,13 +507,125 @@ class ThumbnailImageStorage(AbstractImageStorage):
     Image, resized if larger than given resize_to, aspect ratio is being kept (uses PIL.Image.thumbnail())
     """
 
-    def process_picture(self, file):
-        """ Process the incomming file, returns Image object """
-        image = Image.open(file)
-        image.thumbnail(self.resize_to, resample=self.resample)
+    def target_size(self, size: tuple) -> tuple:
+        scale = min(self.resize_to[0] / size[0], self.resize_to[1] / size[1], 1)
+        return (size[0] * scale, size[1] * scale)
+
+    def process_image(self, image):
+        # Uses draft mode and `reduce` with `reducing_gap`
+        image.thumbnail(self.resize_to, resample=self.resample, reducing_gap=self.reducing_gap)
+
+        return image
+
+
+class RenderedImage(File):
+    """ An image already processed and encoded for a storage (see `ImageRenditions`), saved as is """
+
+    def __init__(self, file, name=None, hexdigest: Optional[str] = None):
+        super().__init__(file, name)
+        self.hexdigest = hexdigest
 
+
+def _render_image(storage: AbstractImageStorage, image: Image.Image):
+    """ Runs in a worker process of `ImageRenditions` """
+    file = storage.encode(storage.process_image(image))
+    hexdigest = storage._hexdigest(file) if storage.hash_algo else None
+    file.seek(0)
+    return file.read(), hexdigest
+
+
+def _area(size: tuple) -> float:
+    return size[0] * size[1]
+
+
+_rendition_executor = None
+_rendition_executor_lock = threading.Lock()
+
+
+def _get_rendition_executor() -> ProcessPoolExecutor:
+    global _rendition_executor
+    with _rendition_executor_lock:
+        if _rendition_executor is None:
+            _rendition_executor = ProcessPoolExecutor(max_workers=app_settings.IMAGE_RENDITION_PROCESSES)
+
+        return _rendition_executor
+
+
+class ImageRenditions:
+    """
+    Renders one uploaded image for several `AbstractImageStorage`s (e.g. thumb, medium and large), keyed by name.
+
+    The source is decoded once, at the smallest draft size sufficient for all renditions (`max_pixels` of each
+    storage is enforced). From largest to smallest, it is reduced by integer factors (`Image.reduce`) as far as
+    `reducing_gap` allows, so each rendition starts from the smallest sufficient intermediate. Resampling, encoding,
+    `post_process` and hashing run in `executor`, by default a shared `ProcessPoolExecutor` with
+    `IMAGE_RENDITION_PROCESSES` workers; storages (including `post_process`) must therefore be picklable.
+
+    As the renditions are derived from other intermediates than when saving each storage separately, their pixels
+    and therefore their content hashes (stored names) differ from `storage.save`. Save the renditions of a field
+    through the same path, or the same upload is stored twice under different names.
+    """
+
+    def __init__(self, storages: Dict[str, AbstractImageStorage], reducing_gap: Optional[float] = 2.0, executor: Optional[Executor] = None):
+        self.storages = storages
+        self.reducing_gap = reducing_gap
+        self.executor = executor
+
+    @classmethod
+    def for_fields(cls, model, *field_names, **kwargs) -> 'ImageRenditions':
+        """ Renditions for the storages of the file fields `field_names` of `model` """
+        return cls({name: model._meta.get_field(name).storage for name in field_names}, **kwargs)
+
+    def open_image(self, file) -> Image.Image:
+        """ Open and decode `file` at the smallest size sufficient for all renditions """
+        strictest = min(self.storages.values(), key=lambda storage: storage.max_pixels or float('inf'))
+        image = strictest.open_image(file)
+        if self.reducing_gap:
+            sizes = [storage.target_size(image.size) for storage in self.storages.values()]
+            size = tuple(max(dimension) for dimension in zip(*sizes))
+            image.draft(None, (int(size[0] * self.reducing_gap), int(size[1] * self.reducing_gap)))
+
+        image.load()
         return image
 
+    def render(self, file) -> Dict[str, RenderedImage]:
+        """ Process and encode `file` for all storages """
+        image = self.open_image(file)
+        executor = self.executor or _get_rendition_executor()
+        futures = {}
+        renditions = sorted(self.storages.items(), key=lambda item: _area(item[1].target_size(image.size)), reverse=True)
+        for key, storage in renditions:
+            if self.reducing_gap:
+                size = storage.target_size(image.size)
+                factor = int(min(image.size[0] / (size[0] * self.reducing_gap), image.size[1] / (size[1] * self.reducing_gap)))
+                if factor > 1:
+                    image = image.reduce(factor)
+
+            futures[key] = executor.submit(_render_image, storage, image)
+
+        rendered = {}
+        for key, future in futures.items():
+            data, hexdigest = future.result()
+            rendered[key] = RenderedImage(BytesIO(data), hexdigest=hexdigest)
+
+        return rendered
+
+    def save(self, name, content) -> Dict[str, str]:
+        """ Render `content` and save it to all storages, returns the stored names """
+        rendered = self.render(content)
+        return {key: self.storages[key].save(name, rendered[key]) for key in self.storages}
+
+    def save_to(self, instance, content, save: bool = True):
+        """ Like `FieldFile.save` for all fields of `instance` given to `for_fields`, rendering `content` once """
+        rendered = self.render(content)
+        for key, file in rendered.items():
+            field = instance._meta.get_field(key)
+            name = field.generate_filename(instance, content.name)
+            setattr(instance, field.attname, self.storages[key].save(name, file, max_length=field.max_length))
+
+        if save:
+            instance.save()
+
 
 # Original code from "olympus", Copyright (C) 2021  LaVita GmbH / Digital Solutions, LGPLv2.1
 # https://github.com/LaVita-GmbH/olympus
@@ -211,37 +646,85 @@ class JSONArrayElements(Func):
 
 
 class JSONExtractPath(Func):
+    """ Value at the path `*path` (one key per argument) """
     function = 'jsonb_extract_path'
-    arity = 2
 
-    def __init__(self, jsonb, path):
-        super().__init__(jsonb, Value(path, output_field=CharField()), output_field=JSONField())
+    def __init__(self, jsonb, *path):
+        super().__init__(jsonb, *(Value(key, output_field=CharField()) for key in path), output_field=JSONField())
 
 
 class JSONExtractPathText(Func):
+    """ Value at the path `*path` (one key per argument) as text """
     function = 'jsonb_extract_path_text'
+
+    def __init__(self, jsonb, *path):
+        super().__init__(jsonb, *(Value(key, output_field=CharField()) for key in path), output_field=CharField())
+
+
+class JSONPathQueryFirst(Func):
+    """ First item returned by the SQL/JSON path expression `path` """
+    function = 'jsonb_path_query_first'
+    template = '%(function)s(%(expressions)s::jsonpath)'
     arity = 2
 
-    def __init__(self, jsonb, path):
-        super().__init__(jsonb, Value(path, output_field=CharField()), output_field=CharField())
+    def __init__(self, jsonb, path: str):
+        super().__init__(jsonb, Value(path, output_field=CharField()), output_field=JSONField())
+
+
+class JSONPathExists(Func):
+    """ Whether the SQL/JSON path expression `path` returns any item (`@?`), can be served by a GIN index """
+    template = '%(expressions)s::jsonpath'
+    arg_joiner = ' @? '
+    arity = 2
+
+    def __init__(self, jsonb, path: str):
+        super().__init__(jsonb, Value(path, output_field=CharField()), output_field=BooleanField())
+
+
+class JSONPathMatch(Func):
+    """ Result of the SQL/JSON path predicate `path` (`@@`), can be served by a GIN index """
+    template = '%(expressions)s::jsonpath'
+    arg_joiner = ' @@ '
+    arity = 2
+
+    def __init__(self, jsonb, path: str):
+        super().__init__(jsonb, Value(path, output_field=CharField()), output_field=BooleanField())
+
+
+class JSONContains(Func):
+    """ Whether `jsonb` contains `value` (`@>`), can be served by a GIN index """
+    template = '%(expressions)s'
+    arg_joiner = ' @> '
+    arity = 2
+
+    def __init__(self, jsonb, value):
+        super().__init__(jsonb, Value(value, output_field=JSONField()), output_field=BooleanField())
 
 
 class RandomIDField(models.CharField):
     description = "A primary key field based on random characters with a given length"
 
-    def __init__(self, length: int, *args, **kwargs):
+    def __init__(self, length: int, *args, allowed_chars: str = RANDOM_STRING_CHARS, **kwargs):
         self.length = length
+        self.allowed_chars = allowed_chars
         kwargs.setdefault('editable', False)
         kwargs.setdefault('primary_key', True)
         kwargs['max_length'] = self.length
 
         super().__init__(*args, **kwargs)
 
+    @property
+    def generator(self) -> RandomStringGenerator:
+        return get_random_string_generator(self.allowed_chars)
+
     def has_default(self):
         return True
 
     def get_default(self):
-        return get_random_string(self.length)
+        return self.generator.generate(self.length)
+
+    def generate_many(self, n: int) -> List[str]:
+        return self.generator.generate_many(n, self.length)
 
     def deconstruct(self):
         name, path, args, keywords = super().deconstruct()
@@ -251,5 +734,49 @@ class RandomIDField(models.CharField):
             'primary_key': self.primary_key,
             'editable': self.editable,
         })
+        if self.allowed_chars != RANDOM_STRING_CHARS:
+            keywords['allowed_chars'] = self.allowed_chars
 
         return name, path, args, keywords
+
+
+def bulk_create_random_ids(model, objs, field_name: Optional[str] = None, max_attempts: int = 10, **kwargs):
+    """
+    `bulk_create` for models with a `RandomIDField`.
+    IDs are already assigned by the field default when the objects are instantiated (explicitly emptied IDs are
+    filled in here). Collisions (within `objs` and with existing rows) are regenerated in batches (`generate_many`),
+    using a single `__in` query per attempt instead of one query per row.
+    Additional `kwargs` are passed to `bulk_create`.
+    """
+    objs = list(objs)
+    field = model._meta.get_field(field_name) if field_name else model._meta.pk
+    if not isinstance(field, RandomIDField):
+        raise TypeError("%s.%s is not a RandomIDField" % (model.__name__, field.name))
+
+    pending = [obj for obj in objs if not getattr(obj, field.attname)]
+    check = objs
+    for _ in range(max_attempts):
+        for obj, value in zip(pending, field.generate_many(len(pending))):
+            setattr(obj, field.attname, value)
+
+        seen = set()
+        collided = []
+        for obj in objs:
+            value = getattr(obj, field.attname)
+            if value in seen:
+                collided.append(obj)
+
+            seen.add(value)
+
+        existing = set(
+            model._default_manager.filter(
+                **{'%s__in' % field.name: {getattr(obj, field.attname) for obj in check}}
+            ).values_list(field.attname, flat=True)
+        )
+        collided += [obj for obj in check if getattr(obj, field.attname) in existing]
+        if not collided:
+            return model._default_manager.bulk_create(objs, **kwargs)
+
+        pending = check = collided
+
+    raise ValueError('cannot_generate_unique_ids')
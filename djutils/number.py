@@ -3,11 +3,16 @@ Original code from 'olympus', Copyright (C) 2021  LaVita GmbH / Digital Solution
 https://github.com/LaVita-GmbH/olympus
 '''
 
-from typing import Optional
+from typing import Callable, List, Optional, Tuple
 import hmac
+import threading
+from collections import OrderedDict
+from functools import partial
 from django.db import connection, ProgrammingError, InternalError
-from django.db.transaction import atomic
+from django.db.transaction import atomic, on_commit
 from django.utils import timezone
+from asgiref.sync import sync_to_async
+from . import app_settings
 
 try:
     from psycopg2.extensions import quote_ident
@@ -25,6 +30,261 @@ except ImportError:
     )
 
 
+class NumberBlockAllocator:
+    """
+    Hands out sequence values from blocks reserved per process.
+
+    The sequence is switched to `INCREMENT BY block_size`, so each `nextval` reserves the values
+    `(value - increment, value]` for this process, which are then served from memory.
+    Gap semantics: values of a block which are not handed out before the process exits are lost, and numbers are
+    only ascending per process, not across processes. Plain `number_generator` calls on the same sequence stay safe,
+    they just consume a whole block each. All processes should use the same block size for a sequence.
+    Each sequence has its own lock, so a round trip for one sequence does not block the others.
+    """
+
+    def __init__(self):
+        self._blocks = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _get_lock(self, sequence_name: str) -> threading.Lock:
+        with self._lock:
+            lock = self._locks.get(sequence_name)
+            if lock is None:
+                lock = self._locks[sequence_name] = threading.Lock()
+
+            return lock
+
+    def take(self, sequence_name: str, block_size: int, count: int = 1) -> List[int]:
+        """ Take `count` ascending values, missing blocks are reserved in a single round trip """
+        with self._get_lock(sequence_name):
+            current, last = self._blocks.get(sequence_name, (0, 0))
+            values = list(range(current + 1, min(last, current + count) + 1))
+            while len(values) < count:
+                missing = count - len(values)
+                for block_last, increment in _nextblocks(sequence_name, block_size, -(-missing // block_size)):
+                    if len(values) >= count:
+                        # Surplus block (the sequence's increment exceeds `block_size`), its values are lost
+                        break
+
+                    current, last = block_last - increment, block_last
+                    taken = min(increment, count - len(values))
+                    values.extend(range(current + 1, current + taken + 1))
+
+            if values:
+                current = values[-1]
+
+            self._blocks[sequence_name] = (current, last)
+            return values
+
+    def next(self, sequence_name: str, block_size: int) -> int:
+        return self.take(sequence_name, block_size)[0]
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self._locks.clear()
+
+
+block_allocator = NumberBlockAllocator()
+
+
+class KnownSequences:
+    """
+    Bounded registry (LRU) of sequences which are known to exist.
+    Known sequences are queried without the `atomic()` savepoint which is needed to recover from a missing sequence.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._sequences = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, sequence_name: str) -> bool:
+        with self._lock:
+            if sequence_name not in self._sequences:
+                return False
+
+            self._sequences.move_to_end(sequence_name)
+            return True
+
+    def add(self, sequence_name: str):
+        with self._lock:
+            self._sequences[sequence_name] = True
+            self._sequences.move_to_end(sequence_name)
+            while len(self._sequences) > self.maxsize:
+                self._sequences.popitem(last=False)
+
+    def discard(self, sequence_name: str):
+        with self._lock:
+            self._sequences.pop(sequence_name, None)
+
+    def clear(self):
+        with self._lock:
+            self._sequences.clear()
+
+
+known_sequences = KnownSequences(app_settings.NUMBER_GENERATOR_KNOWN_SEQUENCES_SIZE)
+
+
+def _is_undefined_table(error: Exception) -> bool:
+    return bool(
+        (UNDEFINED_TABLE and error.__cause__.pgcode == UNDEFINED_TABLE)
+        or (UndefinedTable and isinstance(error.__cause__, UndefinedTable))
+    )
+
+
+def _create_sequence(cursor, sequence_name: str, increment: int = 1):
+    cursor.execute(
+        'CREATE SEQUENCE IF NOT EXISTS %s START %d INCREMENT BY %d;'
+        % (quote_ident(sequence_name, cursor.cursor), increment, increment)
+    )
+
+
+def _alter_sequence_increment(cursor, sequence_name: str, increment: int):
+    cursor.execute('ALTER SEQUENCE %s INCREMENT BY %d;' % (quote_ident(sequence_name, cursor.cursor), increment))
+
+
+def _execute_autonomous(execute: Callable, *args):
+    """
+    Call `execute(cursor, *args)` with a cursor of a separate autocommit connection.
+    DDL on a sequence locks it until commit, which would block `nextval` of all other callers (and processes) until
+    the caller's transaction ends.
+    """
+    autonomous = connection.copy()
+    try:
+        with autonomous.cursor() as cursor:
+            execute(cursor, *args)
+
+    finally:
+        autonomous.close()
+
+
+def _fetch_from_sequence(sequence_name: str, query: str, params: Optional[dict] = None, increment: int = 1, autonomous: bool = False) -> list:
+    """
+    Execute `query` with the quoted `sequence` name, the sequence is created if it does not exist.
+    With `autonomous`, it is created outside of the caller's transaction (see `_execute_autonomous`).
+    """
+    if sequence_name in known_sequences:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(query, {**(params or {}), 'sequence': quote_ident(sequence_name, cursor.cursor)})
+                return cursor.fetchall()
+
+        except (ProgrammingError, InternalError) as error:
+            known_sequences.discard(sequence_name)
+            # Without the savepoint, the surrounding transaction cannot be recovered
+            if not _is_undefined_table(error) or connection.in_atomic_block:
+                raise
+
+    i = 0
+
+    while i < 2:
+        try:
+            with connection.cursor() as cursor:
+                with atomic():
+                    cursor.execute(query, {**(params or {}), 'sequence': quote_ident(sequence_name, cursor.cursor)})
+                    rows = cursor.fetchall()
+
+            # A sequence created within a transaction is only known to exist once it is committed
+            on_commit(partial(known_sequences.add, sequence_name))
+            return rows
+
+        except (ProgrammingError, InternalError) as error:
+            if not _is_undefined_table(error):
+                raise
+
+            i += 1
+            if autonomous:
+                _execute_autonomous(_create_sequence, sequence_name, increment)
+                continue
+
+            with connection.cursor() as cursor:
+                with atomic():
+                    _create_sequence(cursor, sequence_name, increment)
+
+    raise ValueError('cannot_obtain_next_number')
+
+
+def _nextvals(sequence_name: str, count: int = 1) -> List[int]:
+    if count == 1:
+        rows = _fetch_from_sequence(sequence_name, 'SELECT nextval(%(sequence)s);')
+
+    else:
+        rows = _fetch_from_sequence(
+            sequence_name,
+            'SELECT nextval(%(sequence)s) FROM generate_series(1, %(count)s);',
+            {'count': count},
+        )
+
+    return sorted(int(row[0]) for row in rows)
+
+
+def _nextblocks(sequence_name: str, block_size: int, count: int = 1) -> List[Tuple[int, int]]:
+    """
+    Reserve the next `count` blocks of `sequence_name`, returns the last value of each block and its size.
+    The size is read along with the value, so a block is never larger than what the sequence actually reserved.
+    Creating the sequence and changing its increment happen outside of the caller's transaction, as the lock taken by
+    the DDL would otherwise be held while the allocator's lock for the sequence is needed again.
+    """
+    rows = _fetch_from_sequence(
+        sequence_name,
+        'SELECT nextval(%(sequence)s), seqincrement FROM generate_series(1, %(count)s), pg_sequence '
+        'WHERE seqrelid = %(sequence)s::regclass;',
+        {'count': count},
+        increment=block_size,
+        autonomous=True,
+    )
+    if any(increment != block_size for _, increment in rows):
+        _execute_autonomous(_alter_sequence_increment, sequence_name, block_size)
+
+    return sorted((int(value), int(increment)) for value, increment in rows)
+
+
+class _NumberFormatter:
+    """ Formats sequence values, the checksum HMAC is prepared once and copied per number """
+
+    def __init__(
+        self,
+        number_format: str,
+        checksum_salt: Optional[str] = None,
+        checksum_algorithm: Optional[str] = None,
+        checksum_length: Optional[int] = None,
+        checksum_format: Optional[str] = None,
+    ):
+        now = timezone.now()
+        self.number_format = number_format
+        self.date = {
+            'year': now.year,
+            'month': now.month,
+        }
+        self.checksum_length = checksum_length
+        self.checksum_format = checksum_format
+        self.checksum_hmac = None
+        if checksum_length and checksum_length > 0:
+            self.checksum_hmac = hmac.new(checksum_salt, digestmod=checksum_algorithm)
+            self.checksum_modulo = 10**checksum_length
+
+    def __call__(self, nextnumber: int) -> str:
+        number = self.number_format % {
+            **self.date,
+            'number': nextnumber,
+        }
+
+        if self.checksum_hmac:
+            checksum_value = self.checksum_hmac.copy()
+            checksum_value.update(bytes(number, 'utf-8'))
+            checksum_int = int(checksum_value.hexdigest(), 16)
+            checksum_number = checksum_int % self.checksum_modulo
+            checksum = '%0*d' % (self.checksum_length, checksum_number)
+            number = self.checksum_format % {
+                'number': number,
+                'checksum': checksum,
+            }
+
+        return number
+
+
 def number_generator(
     tenant_id: str,
     sequence_name: str,
@@ -33,54 +293,87 @@ def number_generator(
     checksum_algorithm: Optional[str] = None,
     checksum_length: Optional[int] = None,
     checksum_format: Optional[str] = None,
+    block_size: Optional[int] = app_settings.NUMBER_GENERATOR_BLOCK_SIZE,
 ) -> str:
+    """
+    Generate the next number of the sequence `sequence_name` for the tenant `tenant_id`.
+    With `block_size` set, values are served from a per-process block, see `NumberBlockAllocator`.
+    """
+    return number_generator_many(
+        tenant_id,
+        sequence_name,
+        1,
+        number_format,
+        checksum_salt=checksum_salt,
+        checksum_algorithm=checksum_algorithm,
+        checksum_length=checksum_length,
+        checksum_format=checksum_format,
+        block_size=block_size,
+    )[0]
+
+
+def number_generator_many(
+    tenant_id: str,
+    sequence_name: str,
+    count: int,
+    number_format: str,
+    checksum_salt: Optional[str] = None,
+    checksum_algorithm: Optional[str] = None,
+    checksum_length: Optional[int] = None,
+    checksum_format: Optional[str] = None,
+    block_size: Optional[int] = app_settings.NUMBER_GENERATOR_BLOCK_SIZE,
+) -> List[str]:
+    """
+    Generate the next `count` numbers of the sequence `sequence_name` for the tenant `tenant_id` in sequence order.
+    All values are fetched in a single round trip (`nextval` over `generate_series`).
+    """
     if not tenant_id:
         raise ValueError('Tenant-ID not given')
 
+    if count < 1:
+        return []
+
     sequence_name = f'{sequence_name}_{tenant_id}'
-    val = None
-    i = 0
+    if block_size and block_size > 1:
+        values = block_allocator.take(sequence_name, block_size, count)
 
-    while not val and i < 2:
-        try:
-            with connection.cursor() as cursor:
-                with atomic():
-                    cursor.execute('SELECT nextval(%s);', (quote_ident(sequence_name, cursor.cursor),))
-                    val = cursor.fetchone()
-                    break
+    else:
+        values = _nextvals(sequence_name, count)
 
-        except (ProgrammingError, InternalError) as error:
-            if (UNDEFINED_TABLE and error.__cause__.pgcode != UNDEFINED_TABLE) or (
-                UndefinedTable and not isinstance(error.__cause__, UndefinedTable)
-            ):
-                raise
+    formatter = _NumberFormatter(
+        number_format,
+        checksum_salt=checksum_salt,
+        checksum_algorithm=checksum_algorithm,
+        checksum_length=checksum_length,
+        checksum_format=checksum_format,
+    )
+    return [formatter(value) for value in values]
+
+
+def ensure_sequences(sequence_name: str, tenant_ids: List[str], block_size: Optional[int] = app_settings.NUMBER_GENERATOR_BLOCK_SIZE):
+    """
+    Create the sequences `sequence_name` for all `tenant_ids` upfront (e.g. at deploy time), so the first number of a
+    tenant does not need to take the creation path.
+    """
+    if not all(tenant_ids):
+        raise ValueError('Tenant-ID not given')
+
+    increment = block_size if block_size and block_size > 1 else 1
+    sequence_names = [f'{sequence_name}_{tenant_id}' for tenant_id in tenant_ids]
+    with connection.cursor() as cursor:
+        with atomic():
+            for name in sequence_names:
+                _create_sequence(cursor, name, increment)
+
+    for name in sequence_names:
+        on_commit(partial(known_sequences.add, name))
+
+
+async def anumber_generator(*args, **kwargs) -> str:
+    """ Async variant of `number_generator` """
+    return await sync_to_async(number_generator)(*args, **kwargs)
 
-            i += 1
-            with connection.cursor() as cursor:
-                with atomic():
-                    cursor.execute(
-                        'CREATE SEQUENCE IF NOT EXISTS %s START 1;' % quote_ident(sequence_name, cursor.cursor)
-                    )
-
-    if not val:
-        raise ValueError('cannot_obtain_next_number')
-
-    nextnumber = int(val[0])
-    now = timezone.now()
-    number = number_format % {
-        'year': now.year,
-        'month': now.month,
-        'number': nextnumber,
-    }
-
-    if checksum_length and checksum_length > 0:
-        checksum_value = hmac.new(checksum_salt, bytes(number, 'utf-8'), digestmod=checksum_algorithm)
-        checksum_int = int(checksum_value.hexdigest(), 16)
-        checksum_number = checksum_int % 10**checksum_length
-        checksum = '%0*d' % (checksum_length, checksum_number)
-        number = checksum_format % {
-            'number': number,
-            'checksum': checksum,
-        }
 
-    return number
+async def anumber_generator_many(*args, **kwargs) -> List[str]:
+    """ Async variant of `number_generator_many` """
+    return await sync_to_async(number_generator_many)(*args, **kwargs)
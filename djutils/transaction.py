@@ -4,22 +4,278 @@ https://github.com/LaVita-GmbH/olympus
 """
 
 import logging
+import threading
+import time
+from collections import OrderedDict
 from contextvars import ContextVar, copy_context
-from asyncio import Future
-from inspect import CO_COROUTINE
-from functools import wraps
+from asyncio import Future, Semaphore, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from inspect import iscoroutinefunction
+from functools import partial, wraps
 from typing import Callable, Optional
+import weakref
+from weakref import WeakKeyDictionary
 from django.db import transaction
 from async_tools import is_async
+from . import app_settings
+from .counters import Counters
 
 
 _logger = logging.getLogger(__name__)
 
+# Kept for backwards compatibility, pending operations are scoped per connection (see `_get_pending`)
 PENDING_TRANSACTION_COMPLETE_OPERATIONS = {}
 pending_transaction_complete_operations: ContextVar[dict] = ContextVar('pending_transaction_complete_operations')
 
+# connection -> PendingOperations
+_pending_operations = WeakKeyDictionary()
+
+
+# Counters of `on_transaction_complete` calls and the time spent executing them
+stats = Counters(registered=0, deduplicated=0, executed=0, failed=0, execution_time=0.0)
+
+
+class _PendingOperation:
+    __slots__ = ('callable', 'done')
+
+    def __init__(self, callable):
+        self.callable = callable
+        self.done = False
+
+
+class PendingOperations(OrderedDict):
+    """
+    Deduplication entries of a connection, bounded to `maxsize` entries (oldest are evicted).
+    Calls keep a reference to their entry, so an evicted entry only stops deduplicating calls registered afterwards.
+    """
+
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if len(self) > self.maxsize:
+            dedup_id, _ = self.popitem(last=False)
+            _logger.warning("Evicted pending operation with dedup_id %r", dedup_id)
+
+
+def _get_pending(connection) -> dict:
+    try:
+        return pending_transaction_complete_operations.get()
+
+    except LookupError:
+        pass
+
+    pending = _pending_operations.get(connection)
+    if pending is None:
+        pending = _pending_operations[connection] = PendingOperations(app_settings.TRANSACTION_COMPLETE_PENDING_MAX_SIZE)
+
+    elif pending and not connection.run_on_commit:
+        # No hook is waiting for its execution, so the entries are left over from rolled back transactions
+        pending.clear()
+
+    return pending
+
+
+def _register_pending(pending: dict, dedup_id, callable) -> _PendingOperation:
+    operation = pending.get(dedup_id)
+    if not isinstance(operation, _PendingOperation) or operation.callable != callable:
+        if isinstance(operation, _PendingOperation):
+            operation.done = True
+
+        operation = pending[dedup_id] = _PendingOperation(callable)
+
+    return operation
+
+# connection -> {callable: _TransactionBatch}
+_pending_batches = WeakKeyDictionary()
+
+
+class _BatchSegment:
+    """ Calls of a batch registered within the same savepoints """
+    __slots__ = ('savepoint_ids', 'calls', 'marker')
+
+    def __init__(self, savepoint_ids: tuple):
+        self.savepoint_ids = savepoint_ids
+        self.calls = {}
+        self.marker = None
+
+
+class _TransactionBatch:
+    """
+    Calls of a batched `on_transaction_complete` target, collected within one (outermost) transaction and delivered
+    by a single `on_commit` hook.
+    Calls are grouped in segments per set of savepoints, each with an empty marker hook registered by `on_commit`.
+    Django drops the hooks of a savepoint when it is rolled back, so the batch and the segments only hold weak
+    references to their hooks and are discarded once a hook is released (immediately under CPython's reference
+    counting).
+    """
+
+    def __init__(self, callable, callback, error_callback):
+        self.callable = callable
+        self.callback = callback
+        self.error_callback = error_callback
+        self.segments = []
+        self.dedup_ids = {}
+        self.hook = None
+
+    @property
+    def is_pending(self) -> bool:
+        return self.hook is not None and self.hook() is not None
+
+    def add(self, connection, args: tuple, dedup_id=None):
+        if dedup_id is not None and dedup_id in self.dedup_ids:
+            _logger.info("Deduplicated call with dedup_id %r to %s", dedup_id, self.callable)
+            stats.add(deduplicated=1)
+            return
+
+        savepoint_ids = tuple(connection.savepoint_ids)
+        if not self.segments or self.segments[-1].savepoint_ids != savepoint_ids:
+            segment = _BatchSegment(savepoint_ids)
+            marker = lambda: None
+            segment.marker = weakref.ref(marker, partial(self._discard, segment))
+            connection.on_commit(marker)
+            self.segments.append(segment)
+
+        segment = self.segments[-1]
+        if dedup_id is None:
+            dedup_id = object()
+
+        else:
+            self.dedup_ids[dedup_id] = segment
+
+        segment.calls[dedup_id] = args
+
+    def _discard(self, segment: _BatchSegment, marker=None):
+        """ The savepoint of `segment` was rolled back (or the batch was delivered) """
+        # Rolled back segments are usually the last ones
+        for index in range(len(self.segments) - 1, -1, -1):
+            if self.segments[index] is segment:
+                del self.segments[index]
+                break
+
+        else:
+            return
+
+        for dedup_id in segment.calls:
+            if self.dedup_ids.get(dedup_id) is segment:
+                del self.dedup_ids[dedup_id]
+
+    def run(self):
+        calls = [args for segment in self.segments if segment.marker() is not None for args in segment.calls.values()]
+        self.segments = []
+        self.deliver(calls)
+
+    def deliver(self, calls: list):
+        start = time.perf_counter()
+        try:
+            result = self.callable(calls)
+            stats.add(executed=1, execution_time=time.perf_counter() - start)
+            if self.callback:
+                self.callback(result)
+
+        except Exception as error:
+            stats.add(failed=1, execution_time=time.perf_counter() - start)
+            if self.error_callback:
+                self.error_callback(error)
+
+            else:
+                _logger.exception(error, exc_info=True, stack_info=True)
+                raise
+
+
+def _get_batch(connection, callable, callback, error_callback) -> _TransactionBatch:
+    batches = _pending_batches.setdefault(connection, {})
+    batch = batches.get(callable)
+    if batch is not None and batch.is_pending:
+        return batch
+
+    batch = batches[callable] = _TransactionBatch(callable, callback, error_callback)
+    context = copy_context()
+
+    def hook():
+        if batches.get(callable) is batch:
+            del batches[callable]
+
+        context.run(batch.run)
+
+    # Registered before the first segment, so it is only dropped together with all segments of the batch
+    batch.hook = weakref.ref(hook)
+    connection.on_commit(hook)
+    return batch
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=app_settings.TRANSACTION_COMPLETE_THREAD_POOL_SIZE,
+                thread_name_prefix='djutils-transaction-complete',
+            )
+
+        return _executor
+
+
+def _set_future_result(future: Future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _create_task(loop, coroutine):
+    return loop.create_task(coroutine)
+
+
+async def _run_async(callable, args, kwargs, future: Future, get_semaphore: Callable):
+    semaphore = get_semaphore(get_running_loop())
+    if semaphore:
+        async with semaphore:
+            return await _run_async(callable, args, kwargs, future, lambda loop: None)
+
+    start = time.perf_counter()
+    try:
+        if iscoroutinefunction(callable):
+            result = await callable(*args, **kwargs)
+
+        else:
+            result = await get_running_loop().run_in_executor(
+                _get_executor(),
+                copy_context().run,
+                partial(callable, *args, **kwargs),
+            )
+
+    except Exception as error:
+        stats.add(failed=1, execution_time=time.perf_counter() - start)
+        if not future.done():
+            future.set_exception(error)
+
+        return
+
+    stats.add(executed=1, execution_time=time.perf_counter() - start)
+    _set_future_result(future, result)
+
+
+def on_transaction_complete(awaitable: bool = False, callback: Optional[Callable] = None, error_callback: Optional[Callable] = None, deduplicate: Optional[Callable] = None, batch: bool = False, concurrency: Optional[int] = app_settings.TRANSACTION_COMPLETE_ASYNC_CONCURRENCY):
+    """
+    Defer calls of the decorated function until the current transaction is committed.
+
+    With `awaitable`, calling the function returns a future of the caller's event loop. After commit, coroutine
+    functions are run as task on that loop and sync functions in a shared thread pool, at most `concurrency` at once
+    per decorated function and loop, so post-commit work runs concurrently.
+
+    With `batch`, calls made within a transaction are collected and the function is called once after commit with the
+    list of the argument tuples of all calls (keyword arguments are not supported). Calls with a `deduplicate` key
+    that is already in the batch are dropped. Outside of a transaction, the function is called immediately with a
+    single argument tuple.
+    """
+    if batch and awaitable:
+        raise AssertionError("Cannot batch awaitable")
 
-def on_transaction_complete(awaitable: bool = False, callback: Optional[Callable] = None, error_callback: Optional[Callable] = None, deduplicate: Optional[Callable] = None):
     def wrapper(callable):
         @wraps(callable)
         def wrapped(*args, **kwargs):
@@ -30,48 +286,75 @@ def on_transaction_complete(awaitable: bool = False, callback: Optional[Callable
             elif awaitable and not is_async_:
                 raise AssertionError("Cannot call awaitable from sync context")
 
-            try:
-                pending = pending_transaction_complete_operations.get()
+            if batch:
+                if kwargs:
+                    raise AssertionError("Cannot pass keyword arguments to batched call")
 
-            except LookupError:
-                pending = PENDING_TRANSACTION_COMPLETE_OPERATIONS
+                stats.add(registered=1)
+                connection = transaction.get_connection()
+                if not connection.in_atomic_block:
+                    single = _TransactionBatch(callable, callback, error_callback)
+                    copy_context().run(single.deliver, [args])
+                    return
 
+                _get_batch(connection, callable, callback, error_callback).add(
+                    connection,
+                    args,
+                    deduplicate(*args) if deduplicate else None,
+                )
+                return
+
+            stats.add(registered=1)
+            connection = transaction.get_connection()
             if deduplicate:
+                pending = _get_pending(connection)
                 dedup_id = deduplicate(*args, **kwargs)
-                pending[dedup_id] = callable
+                operation = _register_pending(pending, dedup_id, callable)
+
+            if awaitable:
+                loop = get_running_loop()
+                future = loop.create_future()
+
+            else:
+                future = None
 
-            future = Future() if awaitable else None
             def call():
                 if deduplicate:
-                    if pending.get(dedup_id) != callable:
+                    if operation.done:
                         _logger.info("Deduplicated call with dedup_id %r to %s", dedup_id, callable)
+                        stats.add(deduplicated=1)
                         if awaitable:
-                            future.set_result(None)
+                            loop.call_soon_threadsafe(_set_future_result, future, None)
 
                         elif callback:
                             callback(None)
 
                         return
 
-                    try:
+                    operation.done = True
+                    if pending.get(dedup_id) is operation:
                         del pending[dedup_id]
 
-                    except KeyError:
-                        pass
+                if awaitable:
+                    # The hook may run in a thread of sync_to_async, the target is run on the loop of the caller
+                    loop.call_soon_threadsafe(
+                        copy_context().run,
+                        _create_task,
+                        loop,
+                        _run_async(callable, args, kwargs, future, get_semaphore),
+                    )
+                    return
 
+                start = time.perf_counter()
                 try:
                     result = callable(*args, **kwargs)
-                    if awaitable:
-                        future.set_result(result)
-
-                    elif callback:
+                    stats.add(executed=1, execution_time=time.perf_counter() - start)
+                    if callback:
                         callback(result)
 
                 except Exception as error:
-                    if awaitable:
-                        future.set_exception(error)
-
-                    elif error_callback:
+                    stats.add(failed=1, execution_time=time.perf_counter() - start)
+                    if error_callback:
                         error_callback(error)
 
                     else:
@@ -80,16 +363,25 @@ def on_transaction_complete(awaitable: bool = False, callback: Optional[Callable
 
             context = copy_context()
 
-            if not transaction.get_connection().in_atomic_block:
+            if not connection.in_atomic_block:
                 context.run(call)
 
             else:
-                transaction.on_commit(lambda: context.run(call))
+                connection.on_commit(lambda: context.run(call))
 
             return future
 
-        if awaitable:
-            wrapped.__code__.co_flags &= CO_COROUTINE
+        semaphores = WeakKeyDictionary()
+
+        def get_semaphore(loop) -> Optional[Semaphore]:
+            if not concurrency:
+                return None
+
+            semaphore = semaphores.get(loop)
+            if semaphore is None:
+                semaphore = semaphores[loop] = Semaphore(concurrency)
+
+            return semaphore
 
         return wrapped
 
@@ -0,0 +1,13 @@
+import django
+from django.conf import settings
+
+
+def pytest_configure():
+    settings.configure(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+        INSTALLED_APPS=['django.contrib.contenttypes', 'django.contrib.auth', 'tests'],
+        DEFAULT_AUTO_FIELD='django.db.models.AutoField',
+        TITLE='djutils',
+        BASE_HTTP_HOST='localhost',
+    )
+    django.setup()
@@ -0,0 +1,31 @@
+import asyncio
+import json
+from unittest import TestCase
+from django.http import Http404
+from django.test import RequestFactory
+from django.views import View
+from djutils.http import exceptions_to_http, respond_json
+
+
+class AsyncView(View):
+    async def get(self, request):
+        return {'ok': True}
+
+
+class FailingAsyncView(View):
+    async def get(self, request):
+        raise Http404('missing')
+
+
+class AsyncViewTestCase(TestCase):
+    def test_respond_json_class_based_async_view(self):
+        view = respond_json(AsyncView.as_view())
+        response = asyncio.run(view(RequestFactory().get('/')))
+
+        self.assertEqual(json.loads(response.content), {'ok': True})
+
+    def test_exceptions_to_http_class_based_async_view(self):
+        view = exceptions_to_http(Http404, status_code=404)(FailingAsyncView.as_view())
+        response = asyncio.run(view(RequestFactory().get('/')))
+
+        self.assertEqual(response.status_code, 404)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+from django.db import connection
+from djutils.models import model_to_dict, queryset_to_dicts, queryset_to_list
+from .models import Author, Book
+
+
+def setUpModule():
+    with connection.schema_editor() as schema_editor:
+        schema_editor.create_model(Author)
+        schema_editor.create_model(Book)
+
+
+def tearDownModule():
+    with connection.schema_editor() as schema_editor:
+        schema_editor.delete_model(Book)
+        schema_editor.delete_model(Author)
+
+
+class SerializerTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.author = Author.objects.create(name='Ada')
+        cls.book = Book.objects.create(title='Notes', author=cls.author)
+
+    @classmethod
+    def tearDownClass(cls):
+        Book.objects.all().delete()
+        Author.objects.all().delete()
+
+    def test_foreign_key_attname(self):
+        expected = {'title': 'Notes', 'author_id': self.author.pk}
+
+        self.assertEqual(model_to_dict(self.book, fields=['title', 'author_id']), expected)
+        self.assertEqual(queryset_to_list(Book.objects.all(), fields=['title', 'author_id']), [expected])
+
+    def test_queryset_to_dicts_foreign_key_attname(self):
+        expected = [{'title': 'Notes', 'author_id': self.author.pk}]
+        for use_values in (None, False):
+            with self.subTest(use_values=use_values):
+                dicts = queryset_to_dicts(Book.objects.all(), fields=['title', 'author_id'], use_values=use_values)
+
+                self.assertEqual(list(dicts), expected)
@@ -0,0 +1,146 @@
+import re
+from contextlib import nullcontext
+from unittest import TestCase, mock
+from django.db import ProgrammingError
+from djutils import number
+
+
+def _undefined_table() -> ProgrammingError:
+    error = ProgrammingError('relation does not exist')
+    if number.UndefinedTable:
+        error.__cause__ = number.UndefinedTable('relation does not exist')
+
+    else:
+        error.__cause__ = mock.Mock(pgcode=number.UNDEFINED_TABLE)
+
+    return error
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.cursor = None
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.database.queries.append(query)
+        match = re.match(r'CREATE SEQUENCE IF NOT EXISTS (\S+)', query)
+        if match:
+            self.database.sequences.add(match.group(1))
+            return
+
+        if params['sequence'] not in self.database.sequences:
+            raise _undefined_table()
+
+        self.rows = [(1,)]
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, sequences=()):
+        self.sequences = set(sequences)
+        self.queries = []
+        self.in_atomic_block = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+
+class KnownSequencesTestCase(TestCase):
+    def test_evicts_least_recently_used(self):
+        known = number.KnownSequences(2)
+        known.add('a')
+        known.add('b')
+        self.assertIn('a', known)  # moves 'a' to the end
+        known.add('c')
+
+        self.assertNotIn('b', known)
+        self.assertIn('a', known)
+        self.assertIn('c', known)
+
+    def test_discard(self):
+        known = number.KnownSequences(2)
+        known.add('a')
+        known.discard('a')
+        known.discard('missing')
+
+        self.assertNotIn('a', known)
+
+
+class FetchFromSequenceTestCase(TestCase):
+    def setUp(self):
+        self.known = number.KnownSequences(10)
+        patches = [
+            mock.patch.object(number, 'known_sequences', self.known),
+            mock.patch.object(number, 'quote_ident', lambda string, cursor: string),
+            mock.patch.object(number, 'atomic', nullcontext),
+            mock.patch.object(number, 'on_commit', lambda func: func()),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def fetch(self, connection):
+        with mock.patch.object(number, 'connection', connection):
+            return number._fetch_from_sequence('invoice_1', 'SELECT nextval(%(sequence)s);')
+
+    def test_creates_missing_sequence_and_registers_it(self):
+        connection = FakeConnection()
+
+        self.assertEqual(self.fetch(connection), [(1,)])
+        self.assertEqual(connection.sequences, {'invoice_1'})
+        self.assertIn('invoice_1', self.known)
+
+    def test_known_sequence_takes_a_single_query(self):
+        connection = FakeConnection(['invoice_1'])
+        self.known.add('invoice_1')
+
+        self.assertEqual(self.fetch(connection), [(1,)])
+        self.assertEqual(len(connection.queries), 1)
+
+    def test_falls_back_if_known_sequence_is_missing(self):
+        connection = FakeConnection()
+        self.known.add('invoice_1')
+
+        self.assertEqual(self.fetch(connection), [(1,)])
+        self.assertEqual(connection.sequences, {'invoice_1'})
+
+    def test_missing_known_sequence_raises_in_transaction(self):
+        connection = FakeConnection()
+        connection.in_atomic_block = True
+        self.known.add('invoice_1')
+
+        with self.assertRaises(ProgrammingError):
+            self.fetch(connection)
+
+        self.assertNotIn('invoice_1', self.known)
+
+    def test_ensure_sequences(self):
+        connection = FakeConnection()
+        with mock.patch.object(number, 'connection', connection):
+            number.ensure_sequences('invoice', ['1', '2'])
+
+        self.assertEqual(connection.sequences, {'invoice_1', 'invoice_2'})
+        self.assertIn('invoice_1', self.known)
+        self.assertIn('invoice_2', self.known)
+
+
+class NumberBlockAllocatorTestCase(TestCase):
+    def test_surplus_block_is_not_cached(self):
+        # The sequence's increment (100) exceeds the block size, the second block is not needed
+        allocator = number.NumberBlockAllocator()
+        blocks = [[(100, 100), (300, 100)], [(500, 100)]]
+        with mock.patch.object(number, '_nextblocks', side_effect=blocks) as nextblocks:
+            self.assertEqual(allocator.take('s', 10, 15), list(range(1, 16)))
+            self.assertEqual(allocator.take('s', 10, 85), list(range(16, 101)))
+            self.assertEqual(allocator.take('s', 10), [401])
+
+        self.assertEqual(nextblocks.call_count, 2)